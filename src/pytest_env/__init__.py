@@ -2,8 +2,12 @@
 
 from __future__ import annotations
 
+from .overlay import environ, getenv, override
 from .version import __version__
 
 __all__ = [
     "__version__",
+    "environ",
+    "getenv",
+    "override",
 ]
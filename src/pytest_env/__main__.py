@@ -0,0 +1,150 @@
+"""Print the environment pytest-env resolves for the tests, without starting a pytest session."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import shlex
+import sys
+from configparser import ConfigParser
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from .resolve import _find_toml_config, _resolve_plan
+
+if sys.version_info >= (3, 11):  # pragma: >=3.11 cover
+    import tomllib
+else:  # pragma: <3.11 cover
+    import tomli as tomllib
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+
+_BOOL_SETTINGS = frozenset({"env_files_skip_if_set", "env_nested_configs"})
+_CONFIG_NAMES = ("pytest.toml", ".pytest.toml", "pytest.ini", ".pytest.ini", "pyproject.toml", "tox.ini", "setup.cfg")
+
+
+class StandaloneConfig:
+    """Stand-in for ``pytest.Config`` that locates and reads the pytest settings the way pytest does."""
+
+    def __init__(
+        self,
+        inipath: Path | None,
+        settings: dict[str, Any],
+        namespace: argparse.Namespace,
+        rootpath: Path | None = None,
+    ) -> None:
+        """Wrap the settings read from ``inipath`` and the parsed command line options."""
+        self.inipath = inipath
+        self.rootpath = rootpath or (inipath.parent if inipath is not None else Path.cwd())
+        self.known_args_namespace = namespace
+        self._settings = settings
+
+    @classmethod
+    def locate(cls, namespace: argparse.Namespace) -> StandaloneConfig:
+        """
+        Use the given configuration file, or the first one with pytest settings from the working directory up.
+
+        Without pytest settings, the first ``pyproject.toml`` or else the closest ``setup.py`` anchors the root
+        directory, as in pytest.
+        """
+        if (inipath := namespace.inifile) is not None:
+            return cls(inipath.absolute(), _read_settings(inipath.absolute()) or {}, namespace)
+        pyproject = None
+        for directory in (cwd := Path.cwd(), *cwd.parents):
+            for name in _CONFIG_NAMES:
+                if not (candidate := directory / name).is_file():
+                    continue
+                if (settings := _read_settings(candidate)) is not None:
+                    return cls(candidate, settings, namespace)
+                if name == "pyproject.toml" and pyproject is None:
+                    pyproject = candidate
+        if pyproject is not None:
+            return cls(pyproject, {}, namespace)
+        setup_py_dir = next((directory for directory in (cwd, *cwd.parents) if (directory / "setup.py").is_file()), cwd)
+        return cls(None, {}, namespace, setup_py_dir)
+
+    def getini(self, name: str) -> Any:  # ruff:ignore[any-type] # mirrors pytest.Config.getini
+        """Value of an INI setting, converted like pytest converts ``bool`` and ``linelist`` settings."""
+        value = self._settings.get(name)
+        if name in _BOOL_SETTINGS:
+            return (
+                value if isinstance(value, bool) else str(value).strip().lower() in {"y", "yes", "t", "true", "on", "1"}
+            )
+        if value is None:
+            return []
+        if isinstance(value, list):
+            return [str(line) for line in value]
+        return [line.strip() for line in value.splitlines() if line.strip()]
+
+
+def _read_settings(path: Path) -> dict[str, Any] | None:
+    """Read the pytest settings of a configuration file, ``None`` when it does not configure pytest."""
+    if path.suffix == ".toml":
+        config = tomllib.loads(path.read_text(encoding="utf-8"))
+        if path.name != "pyproject.toml":
+            return config.get("pytest", {})
+        tool = config.get("tool", {})
+        if "pytest" not in tool:
+            return None
+        return tool["pytest"].get("ini_options", tool["pytest"])
+    parser = ConfigParser(interpolation=None)
+    parser.read(path, encoding="utf-8")
+    section = {"tox.ini": "pytest", "setup.cfg": "tool:pytest"}.get(path.name, "pytest")
+    if parser.has_section(section):
+        return dict(parser.items(section))
+    return None if path.name in {"tox.ini", "setup.cfg"} else {}
+
+
+def _format_shell(changes: dict[str, str | None]) -> str:
+    return "".join(
+        f"unset {key}\n" if value is None else f"export {key}={shlex.quote(value)}\n" for key, value in changes.items()
+    )
+
+
+def _format_dotenv(changes: dict[str, str | None]) -> str:
+    lines = []
+    for key, value in changes.items():
+        if value is None:
+            continue  # .env files cannot unset variables
+        # python-dotenv has no escape for ``${``, so it is written as an unset variable defaulting to ``$``
+        value = value.replace("\\", "\\\\").replace("${", "${:-$}{")  # ruff:ignore[redefined-loop-name]
+        if "'" in value or "\n" in value:
+            escaped = value.replace('"', '\\"').replace("\n", "\\n")
+            lines.append(f'{key}="{escaped}"\n')
+        else:
+            lines.append(f"{key}='{value}'\n")
+    return "".join(lines)
+
+
+def _format_json(changes: dict[str, str | None]) -> str:
+    return json.dumps(changes, indent=2) + "\n"
+
+
+_FORMATTERS: dict[str, Callable[[dict[str, str | None]], str]] = {
+    "shell": _format_shell,
+    "dotenv": _format_dotenv,
+    "json": _format_json,
+}
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Resolve the environment like the pytest plugin and print the variables it sets or unsets."""
+    parser = argparse.ArgumentParser(prog="python -m pytest_env", description=__doc__)
+    parser.add_argument("-c", "--config-file", dest="inifile", type=Path, help="configuration file to read")
+    parser.add_argument("--envfile", help="path to .env file to load, as the pytest option of the same name")
+    parser.add_argument("--envdir", action="append", dest="envdirs", default=[], help="directory to load, repeatable")
+    parser.add_argument("--format", choices=sorted(_FORMATTERS), default="shell", help="output format")
+    namespace = parser.parse_args(argv)
+
+    config = StandaloneConfig.locate(namespace)
+    try:
+        plan, _ = _resolve_plan(config, _find_toml_config(config), namespace.envfile)
+    except (OSError, ValueError, LookupError) as exc:
+        parser.error(str(exc))
+    sys.stdout.write(_FORMATTERS[namespace.format](plan.changes()))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,99 @@
+"""Decrypt ``.env.enc`` files, caching the plaintext so repeated sessions and xdist workers decrypt each file once."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import stat
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+KEY_VAR = "PYTEST_ENV_KEY"
+KEY_FILE_VAR = "PYTEST_ENV_KEY_FILE"
+ENCRYPTED_SUFFIX = ".enc"
+
+_CACHE_DIR = Path(tempfile.gettempdir()) / f"pytest-env-decrypted-{os.getuid() if hasattr(os, 'getuid') else 0}"
+_decrypted: dict[str, str] = {}
+
+
+def decrypt_env_file(env_file: Path, environ: Mapping[str, str] = os.environ) -> str:
+    """
+    Return the plaintext of a Fernet encrypted ``.env`` file.
+
+    The plaintext is kept in memory and in a cache directory only the current user can read, keyed by the hash of the
+    key and the ciphertext, so it is decrypted again only when either changes.
+    """
+    key = _key(env_file, environ)
+    ciphertext = env_file.read_bytes()
+    digest = hashlib.sha256(key + b"\0" + ciphertext).hexdigest()
+    if (plaintext := _decrypted.get(digest)) is None:
+        cache_dir = _private_cache_dir()
+        if (plaintext := _read_cached(cache_dir, digest)) is None:
+            plaintext = _decrypt(env_file, key, ciphertext)
+            _write_cached(cache_dir, digest, plaintext)
+        _decrypted[digest] = plaintext
+    return plaintext
+
+
+def _key(env_file: Path, environ: Mapping[str, str]) -> bytes:
+    if key := environ.get(KEY_VAR):
+        return key.strip().encode()
+    if key_file := environ.get(KEY_FILE_VAR):
+        return Path(key_file).read_bytes().strip()
+    msg = f"Set {KEY_VAR} to the key of {env_file}, or {KEY_FILE_VAR} to a file holding it"
+    raise LookupError(msg)
+
+
+def _decrypt(env_file: Path, key: bytes, ciphertext: bytes) -> str:
+    try:
+        from cryptography.fernet import Fernet, InvalidToken  # ruff:ignore[import-outside-top-level] # optional dependency
+    except ImportError as exc:
+        msg = f"Reading {env_file} needs the cryptography package, install pytest-env[encrypted]"
+        raise ImportError(msg) from exc
+    try:
+        return Fernet(key).decrypt(ciphertext).decode("utf-8")
+    except InvalidToken as exc:
+        msg = f"Could not decrypt {env_file}: wrong key or corrupted file"
+        raise ValueError(msg) from exc
+
+
+def _private_cache_dir() -> Path | None:
+    """Create the cache directory, refusing to use it when other users could read or plant entries."""
+    try:
+        _CACHE_DIR.mkdir(mode=0o700, exist_ok=True)
+        info = _CACHE_DIR.lstat()
+    except OSError:
+        return None
+    if not stat.S_ISDIR(info.st_mode) or info.st_mode & 0o077:
+        return None
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        return None
+    return _CACHE_DIR
+
+
+def _read_cached(cache_dir: Path | None, digest: str) -> str | None:
+    if cache_dir is None:
+        return None
+    try:
+        return (cache_dir / digest).read_text(encoding="utf-8")
+    except OSError:
+        return None
+
+
+def _write_cached(cache_dir: Path | None, digest: str, plaintext: str) -> None:
+    if cache_dir is None:
+        return
+    try:
+        fd, temporary = tempfile.mkstemp(dir=cache_dir)  # created readable by the current user only
+    except OSError:  # such as a full disk, the plaintext then stays in memory only
+        return
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(plaintext)
+        Path(temporary).replace(cache_dir / digest)  # atomic, so concurrent workers never read a partial entry
+    except OSError:
+        Path(temporary).unlink(missing_ok=True)
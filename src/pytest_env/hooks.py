@@ -0,0 +1,26 @@
+"""Hooks through which other plugins take part in resolving the environment."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from .resolve import Entry, Plan
+
+
+@pytest.hookspec
+def pytest_env_collect_sources(config: pytest.Config) -> Iterable[Entry] | None:
+    """
+    Return entries to apply after the configured ones, with the same flag semantics.
+
+    Called before ``conftest.py`` files are loaded, so only installed plugins and ones passed with ``-p`` take part.
+    """
+
+
+@pytest.hookspec
+def pytest_env_resolve(config: pytest.Config, plan: Plan) -> None:
+    """Inspect or change the actions of the resolved plan before they are applied to ``os.environ`` in one batch."""
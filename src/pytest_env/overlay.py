@@ -0,0 +1,82 @@
+"""
+Per-thread and per-task environment overlays.
+
+``os.environ`` is process global, so tests running concurrently in threads or asyncio tasks cannot give the same
+variable different values through it. :func:`override` layers values on top of the session environment for the current
+context only; they are visible through :data:`environ` and :func:`getenv`. Code that reads ``os.environ`` or
+``os.getenv`` directly keeps seeing the session environment.
+"""
+
+from __future__ import annotations
+
+import os
+from collections.abc import Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import MappingProxyType
+from typing import TYPE_CHECKING, overload
+
+if TYPE_CHECKING:
+    from collections.abc import Generator, Iterator
+
+_overrides: ContextVar[Mapping[str, str | None]] = ContextVar("pytest_env_overrides", default=MappingProxyType({}))
+
+
+class _Environ(Mapping[str, str]):
+    """Read-only view of ``os.environ`` with the overrides of the current context on top."""
+
+    def __getitem__(self, key: str) -> str:
+        overrides = _overrides.get()
+        if key in overrides:
+            if (value := overrides[key]) is None:
+                raise KeyError(key)
+            return value
+        return os.environ[key]
+
+    def __iter__(self) -> Iterator[str]:
+        overrides = _overrides.get()
+        yield from (key for key in os.environ if key not in overrides)
+        yield from (key for key, value in overrides.items() if value is not None)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"pytest_env.environ({dict(self)!r})"
+
+
+environ: Mapping[str, str] = _Environ()
+
+
+@overload
+def getenv(key: str) -> str | None: ...
+
+
+@overload
+def getenv(key: str, default: str) -> str: ...
+
+
+def getenv(key: str, default: str | None = None) -> str | None:
+    """Drop-in replacement of :func:`os.getenv` that honors the overrides of the current context."""
+    return environ.get(key, default)
+
+
+@contextmanager
+def override(mapping: Mapping[str, str | None] | None = None, /, **values: str | None) -> Generator[None, None, None]:
+    """
+    Override variables for the current thread or asyncio task until the block exits.
+
+    A value of ``None`` hides the variable. Nested blocks extend the overrides of the enclosing one.
+    """
+    token = _overrides.set(MappingProxyType({**_overrides.get(), **(mapping or {}), **values}))
+    try:
+        yield
+    finally:
+        _overrides.reset(token)
+
+
+__all__ = [
+    "environ",
+    "getenv",
+    "override",
+]
@@ -2,24 +2,59 @@
 
 from __future__ import annotations
 
+import argparse
+import atexit
+import hashlib
+import json
 import os
+import subprocess  # ruff:ignore[suspicious-subprocess-import]
 import sys
-from dataclasses import dataclass
-from typing import TYPE_CHECKING, Any
+from collections import ChainMap
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from tempfile import TemporaryDirectory, mkstemp
+from typing import TYPE_CHECKING, Any, NamedTuple
 
 import pytest
-from dotenv import dotenv_values
+
+from . import hooks
+from .providers import close_providers
+from .resolve import (
+    Action,
+    Entry,
+    Plan,
+    _entry_value,
+    _file_signature,
+    _find_toml_config,
+    _load_private_files,
+    _load_toml_config,
+    _read_env_dir,
+    _read_env_file,
+    _resolve_plan,
+    _with_secrets,
+)
 
 if TYPE_CHECKING:
-    from collections.abc import Generator, Iterator
-    from pathlib import Path
+    from collections.abc import Generator, Iterable, Mapping
+
+    from _pytest.nodes import Node
 
 _env_actions_key = pytest.StashKey[list[str]]()
+_nested_configs_key = pytest.StashKey["NestedConfigs"]()
+_tracker_key = pytest.StashKey["_EnvironTracker"]()
+_overlays_key = pytest.StashKey["_Overlays"]()
+_matrix_key = pytest.StashKey["_Matrix"]()
+_overlay_key = pytest.StashKey["Overlay"]()
+_leaks_key = pytest.StashKey[dict[str, str]]()  # test that left each variable changed, by variable
+_plan_key = pytest.StashKey[Plan]()
+_reads_key = pytest.StashKey[dict[str, list[str]]]()
+
 
-if sys.version_info >= (3, 11):  # pragma: >=3.11 cover
-    import tomllib
-else:  # pragma: <3.11 cover
-    import tomli as tomllib
+def pytest_addhooks(pluginmanager: pytest.PytestPluginManager) -> None:
+    """Register the hooks other plugins implement to contribute to the environment."""
+    pluginmanager.add_hookspecs(hooks)
 
 
 def pytest_addoption(parser: pytest.Parser) -> None:
@@ -27,12 +62,30 @@ def pytest_addoption(parser: pytest.Parser) -> None:
     help_msg = "a line separated list of environment variables of the form (FLAG:)NAME=VALUE"
     parser.addini("env", type="linelist", help=help_msg, default=[])
     parser.addini("env_files", type="linelist", help="a line separated list of .env files to load", default=[])
+    parser.addini(
+        "env_files_private",
+        type="linelist",
+        help="a line separated list of .env files whose variables are only used for expansion, never exported",
+        default=[],
+    )
+    parser.addini(
+        "env_dirs",
+        type="linelist",
+        help="a line separated list of directories holding one file per variable, such as mounted secrets",
+        default=[],
+    )
     parser.addini(
         "env_files_skip_if_set",
         type="bool",
         help="only set .env file variables when not already defined",
         default=False,
     )
+    parser.addini(
+        "env_nested_configs",
+        type="bool",
+        help="apply pytest_env sections of TOML files below the root configuration to the tests of their subtree",
+        default=False,
+    )
     parser.addoption(
         "--envfile",
         action="store",
@@ -40,6 +93,66 @@ def pytest_addoption(parser: pytest.Parser) -> None:
         default=None,
         help="path to .env file to load (prefix with + to extend config files, otherwise replaces them)",
     )
+    parser.addoption(
+        "--envdir",
+        action="append",
+        dest="envdirs",
+        default=[],
+        help="directory holding one file per variable to load after the configured env_dirs (may be repeated)",
+    )
+    parser.addoption(
+        "--pytest-env-handoff",
+        action="store_true",
+        dest="pytest_env_handoff",
+        default=False,
+        help="publish the resolved environment so nested pytest sessions with the same configuration reuse it",
+    )
+    parser.addoption(
+        "--pytest-env-fork-snapshot",
+        action="store_true",
+        dest="pytest_env_fork_snapshot",
+        default=False,
+        help="keep the resolved environment so sessions in processes forked from this one reuse it",
+    )
+    parser.addoption(
+        "--pytest-env-check-leaks",
+        action="store_true",
+        dest="pytest_env_check_leaks",
+        default=False,
+        help="report tests that change environment variables without restoring them",
+    )
+    parser.addoption(
+        "--pytest-env-changed",
+        action="store_true",
+        dest="pytest_env_changed",
+        default=False,
+        help="record the variables each test reads and only run tests reading variables changed since the last run",
+    )
+    parser.addoption(
+        "--pytest-env-group",
+        action="store_true",
+        dest="pytest_env_group",
+        default=False,
+        help="run tests needing the same environment overlay next to each other to minimize environment switches",
+    )
+    parser.addoption(
+        "--env-matrix",
+        action="store",
+        dest="env_matrix",
+        default=None,
+        help="comma separated .env files (as accepted by --envfile) to run the whole session against, in parallel",
+    )
+    parser.addoption(
+        "--env-matrix-workers",
+        action="store",
+        type=int,
+        dest="env_matrix_workers",
+        default=None,
+        help="maximum number of --env-matrix variants running at the same time (default: number of CPUs)",
+    )
+    parser.addoption(
+        "--pytest-env-matrix-report", dest="pytest_env_matrix_report", default=None, help=argparse.SUPPRESS
+    )
     parser.addoption(
         "--pytest-env-verbose",
         action="store_true",
@@ -49,17 +162,6 @@ def pytest_addoption(parser: pytest.Parser) -> None:
     )
 
 
-@dataclass
-class Entry:
-    """Configuration entries."""
-
-    key: str
-    value: str
-    transform: bool
-    skip_if_set: bool
-    unset: bool = False
-
-
 @pytest.hookimpl(tryfirst=True)
 def pytest_load_initial_conftests(
     args: list[str],  # ruff:ignore[unused-function-argument]
@@ -67,193 +169,765 @@ def pytest_load_initial_conftests(
     parser: pytest.Parser,  # ruff:ignore[unused-function-argument]
 ) -> None:
     """Load environment variables from configuration files."""
-    verbose = getattr(early_config.known_args_namespace, "pytest_env_verbose", False)
-    actions: list[tuple[str, str, str, str]] = []
-
-    env_files_list: list[str] = []
-    env_files_skip_if_set: bool | None = None
-    if toml_config := _find_toml_config(early_config):
-        env_files_list, _, env_files_skip_if_set = _load_toml_config(toml_config)
-
-    if env_files_skip_if_set is None:
-        env_files_skip_if_set = bool(early_config.getini("env_files_skip_if_set"))
-
-    _apply_env_files(
-        early_config,
-        env_files_list,
-        actions if verbose else None,
-        skip_if_set=env_files_skip_if_set,
+    toml_path = _find_toml_config(early_config)
+    extra = [
+        entry for entries in early_config.hook.pytest_env_collect_sources(config=early_config) for entry in entries
+    ]
+    snapshot = None
+    if variants := _matrix_variants(early_config):
+        early_config.stash[_matrix_key] = matrix = _resolve_matrix(early_config, toml_path, variants, extra)
+        plan = matrix.plans[variants[0]]  # conftest files are imported with the first variant
+    else:
+        envfile = getattr(early_config.known_args_namespace, "envfile", None)
+        fingerprint = _handoff_fingerprint(early_config, toml_path, envfile, extra)
+        fork_snapshot = getattr(early_config.known_args_namespace, "pytest_env_fork_snapshot", False)
+        if fork_snapshot and (snapshot := _forked_snapshot(fingerprint)) is not None:
+            plan = snapshot.plan
+        elif (plan := _load_handoff(fingerprint)) is None:
+            plan, sources = _resolve_with_plugins(early_config, toml_path, envfile, extra)
+            if not plan.generated:
+                if fork_snapshot:
+                    _take_snapshot(fingerprint, sources, plan)
+                if getattr(early_config.known_args_namespace, "pytest_env_handoff", False):
+                    _publish_handoff(fingerprint, sources, plan)
+    if snapshot is None:
+        plan.apply()
+    else:
+        snapshot.reapply()
+    early_config.stash[_plan_key] = plan
+
+    if getattr(early_config.known_args_namespace, "pytest_env_verbose", False) and plan.actions:
+        early_config.stash[_env_actions_key] = _format_actions(plan.actions)
+
+    if plan.nested_root is not None:
+        early_config.stash[_nested_configs_key] = NestedConfigs(plan.nested_root)
+
+
+def _resolve_with_plugins(
+    early_config: pytest.Config, toml_path: Path | None, envfile: str | None, extra: list[Entry]
+) -> tuple[Plan, list[Path]]:
+    """Resolve the plan including the entries of other plugins, and let them change it before it is applied."""
+    plan, sources = _resolve_plan(early_config, toml_path, envfile, extra)
+    early_config.hook.pytest_env_resolve(config=early_config, plan=plan)
+    return plan, sources
+
+
+_HANDOFF_VAR = "PYTEST_ENV_HANDOFF"
+
+
+def _handoff_fingerprint(
+    early_config: pytest.Config, toml_path: Path | None, envfile: str | None, extra: list[Entry]
+) -> str:
+    """Hash the inputs of plan resolution that do not live in source files or ``os.environ``."""
+    inputs = [
+        str(early_config.rootpath),
+        str(early_config.inipath),
+        str(toml_path),
+        envfile,
+        getattr(early_config.known_args_namespace, "envdirs", None),
+        *(list(early_config.getini(name)) for name in ("env", "env_files", "env_files_private", "env_dirs")),
+        *(bool(early_config.getini(name)) for name in ("env_files_skip_if_set", "env_nested_configs")),
+        [repr(entry) for entry in extra],
+    ]
+    return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+
+def _publish_handoff(fingerprint: str, sources: list[Path], plan: Plan) -> None:
+    """Expose the resolved plan to pytest sessions started from this one."""
+    os.environ[_HANDOFF_VAR] = _write_handoff(_handoff_payload(fingerprint, sources, plan))
+
+
+def _write_handoff(payload: str, directory: Path | None = None) -> str:
+    """
+    Store a handoff payload in a file only the current user can read, removed when this process exits.
+
+    A single environment variable is limited in size, so only the digest and path of the file are exported.
+    """
+    fd, path = mkstemp(prefix="pytest-env-handoff-", suffix=".json", dir=directory)
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        file.write(payload)
+    atexit.register(_remove_handoff, Path(path), os.getpid())
+    return f"{hashlib.sha256(payload.encode()).hexdigest()}:{path}"
+
+
+def _remove_handoff(path: Path, pid: int) -> None:
+    if os.getpid() == pid:  # forked children inherit the exit handlers of their parent
+        path.unlink(missing_ok=True)
+
+
+def _signatures(sources: Iterable[Path]) -> dict[str, list[int] | None]:
+    return {str(path): _file_signature(str(path)) for path in sources}
+
+
+def _handoff_payload(fingerprint: str, sources: list[Path], plan: Plan) -> str:
+    payload = {
+        "fingerprint": fingerprint,
+        "sources": _signatures(sources),
+        "inputs": _input_digests(plan),
+        "actions": [action for action in plan.actions if action.action != "PRIV"],  # never export private values
+        "nested_root": None if plan.nested_root is None else str(plan.nested_root),
+    }
+    return json.dumps(payload, separators=(",", ":"))
+
+
+def _input_digests(plan: Plan) -> dict[str, str | None]:
+    """Fingerprint the ``os.environ`` values the resolution of the plan read, without storing the values themselves."""
+    return {key: _digest(value) for key, value in plan.inputs.items()}
+
+
+def _inputs_unchanged(inputs: Mapping[str, str | None], changes: Mapping[str, str | None]) -> bool:
+    """
+    Check that every variable the resolution read still holds the value it read, or the one the plan assigned to it.
+
+    Sessions started from the resolving one inherit the applied plan, so its own values do not count as a change.
+    """
+    for key, digest in inputs.items():
+        current = _digest(os.environ.get(key))
+        if current != digest and (key not in changes or current != _digest(changes[key])):
+            return False
+    return True
+
+
+def _load_handoff(fingerprint: str) -> Plan | None:
+    """Reuse the plan published by an outer session when its inputs and source files are unchanged."""
+    if not (reference := os.environ.get(_HANDOFF_VAR)):
+        return None
+    digest, _, path = reference.partition(":")
+    try:
+        raw = Path(path).read_text(encoding="utf-8")
+    except OSError:
+        return None
+    if hashlib.sha256(raw.encode()).hexdigest() != digest or (payload := json.loads(raw))["fingerprint"] != fingerprint:
+        return None
+    if any(_file_signature(path) != signature for path, signature in payload["sources"].items()):
+        return None
+    nested_root = payload["nested_root"]
+    plan = Plan(
+        actions=[Action._make(action) for action in payload["actions"]],
+        nested_root=None if nested_root is None else Path(nested_root),
     )
-    _apply_entries(early_config, actions if verbose else None)
+    return plan if _inputs_unchanged(payload["inputs"], plan.changes()) else None
 
-    if verbose and actions:
-        early_config.stash[_env_actions_key] = _format_actions(actions)
 
+@dataclass(frozen=True)
+class EnvSnapshot:
+    """
+    Environment plan resolved by a process, reused by the pytest sessions of processes forked from it.
 
-def _apply_env_files(
-    early_config: pytest.Config,
-    env_files_list: list[str],
-    actions: list[tuple[str, str, str, str]] | None,
-    *,
-    skip_if_set: bool = False,
+    Tools keeping a warm pytest process and forking a child per run get the plan of the last session of the parent in
+    each child, which re-applies only the variables that differ instead of resolving the configuration again. A child
+    resolves as usual once the configuration, its command line options, any of the files or any of the ``os.environ``
+    variables it reads change.
+    """
+
+    fingerprint: str  # the inputs of the resolution that do not live in source files or os.environ
+    sources: dict[str, list[int] | None]  # modification time and size of every file read
+    plan: Plan
+    changes: dict[str, str | None]
+    inputs: dict[str, str | None]  # digests of the os.environ variables read
+    pid: int = field(default_factory=os.getpid)
+
+    def changed(self) -> bool:
+        """Whether a file or variable read by the resolution was modified, created or removed since the snapshot."""
+        if any(_file_signature(path) != signature for path, signature in self.sources.items()):
+            return True
+        return not _inputs_unchanged(self.inputs, self.changes)
+
+    def reapply(self) -> dict[str, str | None]:
+        """Apply the changes of the plan ``os.environ`` does not hold, returning them (``None`` for unset variables)."""
+        delta = {key: value for key, value in self.changes.items() if os.environ.get(key) != value}
+        for key, value in delta.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        return delta
+
+
+_snapshots: dict[str, EnvSnapshot] = {}  # only the latest, by fingerprint; module state survives into forked children
+
+
+def last_snapshot() -> EnvSnapshot | None:
+    """Snapshot of the last plan resolved with ``--pytest-env-fork-snapshot``, ``None`` before the first session."""
+    return next(iter(_snapshots.values()), None)
+
+
+def _take_snapshot(fingerprint: str, sources: list[Path], plan: Plan) -> None:
+    _snapshots.clear()
+    _snapshots[fingerprint] = EnvSnapshot(fingerprint, _signatures(sources), plan, plan.changes(), _input_digests(plan))
+
+
+def _forked_snapshot(fingerprint: str) -> EnvSnapshot | None:
+    """Find the snapshot inherited from the parent process, if it still matches the configuration and its files."""
+    if (snapshot := _snapshots.get(fingerprint)) is None or snapshot.pid == os.getpid() or snapshot.changed():
+        return None
+    return snapshot
+
+
+@dataclass
+class _Matrix:
+    """Plans of the ``--env-matrix`` variants, resolved up front by the coordinating process."""
+
+    environ: dict[str, str]
+    plans: dict[str, Plan] = field(default_factory=dict)
+    handoffs: dict[str, str] = field(default_factory=dict)
+
+
+def _matrix_variants(early_config: pytest.Config) -> list[str]:
+    namespace = early_config.known_args_namespace
+    if getattr(namespace, "pytest_env_matrix_report", None) or not (raw := getattr(namespace, "env_matrix", None)):
+        return []
+    return [variant.strip() for variant in raw.split(",") if variant.strip()]
+
+
+def _resolve_matrix(
+    early_config: pytest.Config, toml_path: Path | None, variants: list[str], extra: list[Entry]
+) -> _Matrix:
+    """Resolve the plan of every variant, failing fast on missing files before any worker starts."""
+    matrix = _Matrix(environ=dict(os.environ))
+    for variant in variants:
+        plan, sources = _resolve_with_plugins(early_config, toml_path, variant, extra)
+        matrix.plans[variant] = plan
+        if not plan.generated:  # otherwise each variant generates its own values
+            fingerprint = _handoff_fingerprint(early_config, toml_path, variant, extra)
+            matrix.handoffs[variant] = _handoff_payload(fingerprint, sources, plan)
+    return matrix
+
+
+# options the coordinating process handles for all variants, not passed on to its workers
+_MATRIX_ONLY_OPTIONS = ("--env-matrix", "--env-matrix-workers", "--junitxml", "--junit-xml")
+
+
+def _strip_matrix_args(args: Iterable[str]) -> list[str]:
+    stripped: list[str] = []
+    skip_value = False
+    for arg in args:
+        if skip_value:
+            skip_value = False
+        elif arg in _MATRIX_ONLY_OPTIONS:
+            skip_value = True
+        elif not arg.startswith(tuple(f"{option}=" for option in _MATRIX_ONLY_OPTIONS)):
+            stripped.append(arg)
+    return stripped
+
+
+def _run_variant(command: list[str], cwd: Path, env: dict[str, str]) -> subprocess.CompletedProcess[str]:
+    return subprocess.run(command, cwd=cwd, env=env, capture_output=True, text=True, check=False)  # ruff:ignore[subprocess-without-shell-equals-true]
+
+
+def _run_matrix(session: pytest.Session, matrix: _Matrix) -> None:
+    """Run the session once per variant in a bounded pool of worker processes and replay their results."""
+    config = session.config
+    args = _strip_matrix_args(str(arg) for arg in config.invocation_params.args)
+    workers = config.getoption("env_matrix_workers") or min(len(matrix.plans), os.cpu_count() or 1)
+    with TemporaryDirectory(prefix="pytest-env-matrix-") as tmp, ThreadPoolExecutor(max_workers=workers) as pool:
+        runs: list[tuple[str, Future[subprocess.CompletedProcess[str]], Path]] = []
+        for index, variant in enumerate(matrix.plans):
+            report_path = Path(tmp) / f"{index}.jsonl"
+            command = [sys.executable, "-m", "pytest", *args, "--envfile", variant]
+            command.extend(("-o", f"cache_dir={Path(tmp) / f'cache-{index}'}"))  # workers must not share a cache
+            command.extend(("--pytest-env-matrix-report", str(report_path)))
+            run_env = dict(matrix.environ)
+            if variant in matrix.handoffs:
+                run_env[_HANDOFF_VAR] = _write_handoff(matrix.handoffs[variant], Path(tmp))
+            future = pool.submit(_run_variant, command, config.invocation_params.dir, run_env)
+            runs.append((variant, future, report_path))
+        results = [(variant, future.result(), _read_matrix_reports(config, path)) for variant, future, path in runs]
+
+    session.testscollected = sum(
+        isinstance(report, pytest.TestReport) and report.when == "setup"
+        for _, _, reports in results
+        for report in reports
+    )
+    for variant, completed, reports in results:
+        _replay_matrix_reports(session, variant, reports)
+        if completed.returncode not in {
+            pytest.ExitCode.OK,
+            pytest.ExitCode.TESTS_FAILED,
+            pytest.ExitCode.NO_TESTS_COLLECTED,
+        }:
+            session.testsfailed += 1
+            if (terminal := config.pluginmanager.get_plugin("terminalreporter")) is not None:
+                terminal.section(f"pytest-env matrix variant {variant} exited with {completed.returncode}")
+                terminal.write(completed.stdout + completed.stderr)
+
+
+def _read_matrix_reports(config: pytest.Config, report_path: Path) -> list[pytest.TestReport | pytest.CollectReport]:
+    if not report_path.is_file():
+        return []
+    with report_path.open(encoding="utf-8") as file_handler:
+        return [
+            config.hook.pytest_report_from_serializable(config=config, data=json.loads(line)) for line in file_handler
+        ]
+
+
+def _replay_matrix_reports(
+    session: pytest.Session, variant: str, reports: list[pytest.TestReport | pytest.CollectReport]
 ) -> None:
-    preexisting = dict(os.environ) if skip_if_set else {}
-    for env_file in _load_env_files(early_config, env_files_list):
-        for key, value in dotenv_values(env_file).items():
-            if value is not None:
-                if skip_if_set and key in preexisting:
-                    if actions is not None:
-                        actions.append(("SKIP", key, preexisting[key], str(env_file)))
+    """Feed the reports of a variant to the reporting hooks, labeling each test ID with its variant."""
+    hook = session.config.hook
+    for report in reports:
+        report.nodeid = f"{report.nodeid}@{variant}"
+        if isinstance(report, pytest.CollectReport):
+            hook.pytest_collectreport(report=report)
+            continue
+        if report.when == "setup":
+            hook.pytest_runtest_logstart(nodeid=report.nodeid, location=report.location)
+        hook.pytest_runtest_logreport(report=report)
+        if report.when == "teardown":
+            hook.pytest_runtest_logfinish(nodeid=report.nodeid, location=report.location)
+
+
+class _MatrixReportWriter:
+    """Serialize the reports of a matrix variant for the coordinating process."""
+
+    def __init__(self, config: pytest.Config, path: Path) -> None:
+        self._config = config
+        self._file = path.open("w", encoding="utf-8")
+
+    def _write(self, report: pytest.TestReport | pytest.CollectReport) -> None:
+        data = self._config.hook.pytest_report_to_serializable(config=self._config, report=report)
+        self._file.write(json.dumps(data) + "\n")
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        self._write(report)
+
+    def pytest_collectreport(self, report: pytest.CollectReport) -> None:
+        if report.failed:
+            self._write(report)
+
+    def pytest_unconfigure(self) -> None:
+        self._file.close()
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection(session: pytest.Session) -> bool | None:
+    """Skip collection in the process coordinating an environment matrix, its workers collect instead."""
+    return True if _matrix_key in session.config.stash else None
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtestloop(session: pytest.Session) -> bool | None:
+    """Run the environment matrix variants instead of the tests, if requested."""
+    if (matrix := session.config.stash.get(_matrix_key, None)) is None:
+        return None
+    _run_matrix(session, matrix)
+    return True
+
+
+class EnvPatcher:
+    """Batch environment changes that are undone together, in one pass, by :meth:`undo`."""
+
+    def __init__(self) -> None:
+        """Create a patcher with an empty undo log."""
+        self._undo: dict[str, str | None] = {}
+
+    def _record(self, key: str) -> None:
+        if key not in self._undo:
+            self._undo[key] = os.environ.get(key)
+
+    def update(self, mapping: Mapping[str, str] | None = None, /, **values: str) -> None:
+        """Set every variable in ``mapping`` and ``values``."""
+        with _untracked():
+            for key, value in {**(mapping or {}), **values}.items():
+                self._record(key)
+                os.environ[key] = value
+
+    def unset(self, *keys: str) -> None:
+        """Remove the given variables, ignoring ones that are not set."""
+        with _untracked():
+            for key in keys:
+                self._record(key)
+                os.environ.pop(key, None)
+
+    def apply_entries(self, entries: Iterable[Entry], private: Mapping[str, str] | None = None) -> None:
+        """Apply configuration entries with the same flag semantics as the configuration files."""
+        private_values = dict(private or {})
+        scope = ChainMap(private_values, os.environ)
+        for entry in _with_secrets(entries, os.environ):
+            if entry.unset:
+                private_values.pop(entry.key, None)
+                self.unset(entry.key)
+            elif not (entry.skip_if_set and entry.key in scope):
+                value = _entry_value(entry, scope)
+                if entry.private:
+                    private_values[entry.key] = value
                 else:
-                    os.environ[key] = value
-                    if actions is not None:
-                        actions.append(("SET", key, value, str(env_file)))
+                    private_values.pop(entry.key, None)
+                    self.update({entry.key: value})
+
+    def undo(self) -> None:
+        """Restore every touched variable to the value it had before the first change."""
+        with _untracked():
+            for key, original in self._undo.items():
+                if original is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = original
+        self._undo.clear()
 
 
-def _apply_entries(
-    early_config: pytest.Config,
-    actions: list[tuple[str, str, str, str]] | None,
-) -> None:
-    source = _config_source(early_config) if actions is not None else ""
-    for entry in _load_values(early_config):
-        if entry.unset:
-            os.environ.pop(entry.key, None)
-            if actions is not None:
-                actions.append(("UNSET", entry.key, "", source))
-        elif entry.skip_if_set and entry.key in os.environ:
-            if actions is not None:
-                actions.append(("SKIP", entry.key, os.environ[entry.key], source))
-        else:
-            final = entry.value.format(**os.environ) if entry.transform else entry.value
-            os.environ[entry.key] = final
-            if actions is not None:
-                actions.append(("SET", entry.key, final, source))
+@pytest.fixture
+def env() -> Generator[EnvPatcher, None, None]:
+    """Set environment variables for a single test."""
+    patcher = EnvPatcher()
+    yield patcher
+    patcher.undo()
 
 
-def pytest_report_header(config: pytest.Config) -> list[str] | None:
-    """Display environment variable assignments in test session header."""
-    if _env_actions_key in config.stash:
-        return config.stash[_env_actions_key]
-    return None
+@pytest.fixture(scope="module")
+def module_env() -> Generator[EnvPatcher, None, None]:
+    """Set environment variables for all tests of a module."""
+    patcher = EnvPatcher()
+    yield patcher
+    patcher.undo()
 
 
-def _format_actions(actions: list[tuple[str, str, str, str]]) -> list[str]:
-    lines = ["pytest-env:"]
-    for action, key, value, source in actions:
-        if action == "UNSET":
-            lines.append(f"  {action:<5} {key}  (from {source})")
-        else:
-            lines.append(f"  {action:<5} {key}={value}  (from {source})")
-    return lines
+@pytest.fixture(scope="session")
+def session_env() -> Generator[EnvPatcher, None, None]:
+    """Set environment variables for the whole test session."""
+    patcher = EnvPatcher()
+    yield patcher
+    patcher.undo()
+
+
+_TOML_CONFIG_NAMES = ("pytest.toml", ".pytest.toml", "pyproject.toml")
+
+
+class NestedConfigs:
+    """Memoized directory index of ``pytest_env`` TOML sections below the session configuration."""
+
+    def __init__(self, boundary: Path) -> None:
+        """Index directories strictly below ``boundary``, whose own configuration is applied for the session."""
+        self._boundary = boundary
+        self._index: dict[Path, Path | None] = {boundary: None}
+
+    def lookup(self, directory: Path) -> Path | None:
+        """Return the closest nested configuration governing ``directory``, if any."""
+        if not directory.is_relative_to(self._boundary):
+            return None
+        walked: list[Path] = []
+        current = directory
+        while current not in self._index:
+            walked.append(current)
+            current = current.parent
+        found = self._index[current]
+        for path in reversed(walked):
+            for toml_name in _TOML_CONFIG_NAMES:
+                candidate = path / toml_name
+                if candidate.is_file() and _has_pytest_env_section(candidate):
+                    found = candidate
+                    break
+            self._index[path] = found
+        return self._index[directory]
+
+
+class Overlay(NamedTuple):
+    """Environment a test needs on top of the session environment, hashable to group and switch tests."""
+
+    nested_config: Path | None
+    values: tuple[tuple[str, str], ...]
+
+
+_NO_OVERLAY = Overlay(None, ())
+
+
+class _Overlays:
+    """Switch ``os.environ`` between test overlays, touching it only when consecutive tests need different ones."""
+
+    def __init__(self, nested: NestedConfigs | None) -> None:
+        self._nested = nested
+        self._active = _NO_OVERLAY
+        self._patcher = EnvPatcher()
+
+    def of(self, item: pytest.Item) -> Overlay:
+        """Compute (once) the overlay of a test from its nested configuration and ``pytest_env`` markers."""
+        if (overlay := item.stash.get(_overlay_key, None)) is None:
+            values: dict[str, str] = {}
+            for marker in reversed(list(item.iter_markers("pytest_env"))):
+                values.update((key, str(value)) for key, value in marker.kwargs.items())
+            nested_config = self._nested.lookup(item.path.parent) if self._nested is not None else None
+            overlay = item.stash[_overlay_key] = Overlay(nested_config, tuple(sorted(values.items())))
+        return overlay
+
+    def activate(self, item: pytest.Item) -> None:
+        """Switch to the overlay of ``item``."""
+        if (overlay := self.of(item)) == self._active:
+            return
+        self._patcher.undo()
+        self._active = overlay
+        if overlay.nested_config is not None:
+            _apply_nested_config(self._patcher, overlay.nested_config)
+        self._patcher.update(dict(overlay.values))
+
+    def restore(self) -> None:
+        """Undo the currently active overlay."""
+        self._patcher.undo()
+        self._active = _NO_OVERLAY
+
+
+def _has_pytest_env_section(toml_path: Path) -> bool:
+    config = _load_toml_config(toml_path)
+    return bool(config.entries or config.env_files or config.env_files_private or config.env_dirs)
+
+
+def _apply_nested_config(patcher: EnvPatcher, toml_path: Path) -> None:
+    config = _load_toml_config(toml_path)
+    preexisting = set(os.environ) if config.env_files_skip_if_set else set()
+    for env_file_str in config.env_files:
+        if (env_file := toml_path.parent / env_file_str).is_file():
+            values = _read_env_file(env_file)
+            patcher.update({k: v for k, v in values.items() if v is not None and k not in preexisting})
+    for env_dir_str in config.env_dirs:
+        if (env_dir := toml_path.parent / env_dir_str).is_dir():
+            patcher.update({k: v for k, v in _read_env_dir(env_dir).items() if k not in preexisting})
+    patcher.apply_entries(config.entries, _load_private_files(toml_path.parent, config.env_files_private))
+
+
+@pytest.hookimpl(wrapper=True, tryfirst=True)
+def pytest_runtest_protocol(item: pytest.Item) -> Generator[None, object, object]:
+    """Switch to the environment overlay of the test, check it for leaks and record what it reads, if enabled."""
+    item.config.stash[_overlays_key].activate(item)
+    if (tracker := item.config.stash.get(_tracker_key, None)) is None:
+        return (yield)
+    reads = item.config.stash.get(_reads_key, None)
+    tracker.reads = None if reads is None else set()
+    try:
+        return (yield)
+    finally:
+        if reads is not None:
+            reads[item.nodeid] = tracker.read()
+        if item.config.getoption("pytest_env_check_leaks"):
+            # fixtures of wider scopes restore their changes in the teardown of a later test, which clears the leak
+            leaks = item.config.stash.setdefault(_leaks_key, {})
+            for key, changed in tracker.settle().items():
+                if changed:
+                    leaks.setdefault(key, item.nodeid)
+                else:
+                    leaks.pop(key, None)
 
 
-def _find_toml_config(early_config: pytest.Config) -> Path | None:
-    """Find TOML config file by checking inipath first, then walking up the tree."""
+def pytest_sessionfinish(session: pytest.Session) -> None:
+    """Restore the environment changed by test overlays and remember what tests read, if requested."""
+    session.config.stash[_overlays_key].restore()
+    if (reads := session.config.stash.get(_reads_key, None)) is not None and (cache := _cache(session.config)):
+        cache.set(_READS_CACHE, reads)
+        cache.set(_PLAN_CACHE, _plan_digests(session.config.stash[_plan_key]))
+
+
+def pytest_itemcollected(item: pytest.Item) -> None:
+    """Mark the test with the ``xdist_group`` of its overlay, before pytest-xdist reads the marks of collected tests."""
+    config = item.config
+    # pytest-xdist workers collect with ``dist`` reset to "no" and ``loadgroup`` set instead
+    loadgroup = config.getoption("dist", None) == "loadgroup" or config.getoption("loadgroup", default=False)
+    # tests without an overlay stay ungrouped, so pytest-xdist keeps balancing them across workers
     if (
-        early_config.inipath
-        and early_config.inipath.suffix == ".toml"
-        and early_config.inipath.name in {"pytest.toml", ".pytest.toml", "pyproject.toml"}
+        loadgroup
+        and config.getoption("pytest_env_group")
+        and (overlay := config.stash[_overlays_key].of(item)) != _NO_OVERLAY
     ):
-        return early_config.inipath
-
-    start_path = early_config.inipath.parent if early_config.inipath is not None else early_config.rootpath
-    for current_path in [start_path, *start_path.parents]:
-        for toml_name in ("pytest.toml", ".pytest.toml", "pyproject.toml"):
-            toml_file = current_path / toml_name
-            if toml_file.exists():
-                return toml_file
-    return None
+        digest = hashlib.sha256(repr(overlay).encode()).hexdigest()[:12]
+        item.add_marker(pytest.mark.xdist_group(name=f"pytest-env-{digest}"))
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]) -> None:
+    """Skip tests whose ``requires_env`` markers are unmet and group tests sharing an environment overlay."""
+    if _reads_key in config.stash:
+        _select_changed(config, items)
+    overlays = config.stash[_overlays_key]
+    _skip_unmet_requirements(overlays, items)
+    if not config.getoption("pytest_env_group"):
+        return
+    # group within the parent (module or class) only, so fixtures scoped to it are not set up again
+    groups: dict[tuple[Node | None, Overlay], list[pytest.Item]] = {}
+    for item in items:
+        groups.setdefault((item.parent, overlays.of(item)), []).append(item)
+    items[:] = [item for group in groups.values() for item in group]
 
 
-def _config_source(early_config: pytest.Config) -> str:
-    """Describe the configuration source for verbose output."""
-    if toml_path := _find_toml_config(early_config):
-        _, entries, _ = _load_toml_config(toml_path)
-        if entries:
-            return str(toml_path)
-    if early_config.inipath:
-        return str(early_config.inipath)
-    return "config"  # pragma: no cover
-
-
-def _load_toml_config(config_path: Path) -> tuple[list[str], list[Entry], bool | None]:
-    """Load env_files and entries from TOML config file."""
-    with config_path.open("rb") as file_handler:
-        config = tomllib.load(file_handler)
-
-    if config_path.name == "pyproject.toml":
-        config = config.get("tool", {})
-
-    pytest_env_config = config.get("pytest_env", {})
-    if not pytest_env_config:
-        return [], [], None
-
-    raw_env_files = pytest_env_config.get("env_files")
-    env_files = [str(f) for f in raw_env_files] if isinstance(raw_env_files, list) else []
-    raw_skip = pytest_env_config.get("env_files_skip_if_set")
-    env_files_skip_if_set = raw_skip if isinstance(raw_skip, bool) else None
-
-    entries = list(_parse_toml_config(pytest_env_config))
-    return env_files, entries, env_files_skip_if_set
-
-
-def _load_env_files(early_config: pytest.Config, env_files: list[str]) -> Generator[Path, None, None]:
-    """Resolve and yield existing env files, with CLI option taking precedence."""
-    if cli_envfile := getattr(early_config.known_args_namespace, "envfile", None):
-        if cli_envfile.startswith("+"):
-            if not (resolved := early_config.rootpath / cli_envfile[1:]).is_file():
-                msg = f"Environment file not found: {cli_envfile[1:]}"
-                raise FileNotFoundError(msg)
-            for env_file_str in env_files or list(early_config.getini("env_files")):
-                if (config_resolved := early_config.rootpath / env_file_str).is_file():
-                    yield config_resolved
-            yield resolved
-        else:
-            if not (resolved := early_config.rootpath / cli_envfile).is_file():
-                msg = f"Environment file not found: {cli_envfile}"
-                raise FileNotFoundError(msg)
-            yield resolved
+_READS_CACHE = "pytest-env/reads"
+_PLAN_CACHE = "pytest-env/plan"
+
+
+def _cache(config: pytest.Config) -> pytest.Cache | None:
+    return getattr(config, "cache", None)  # missing when the cacheprovider plugin is disabled
+
+
+def _plan_digests(plan: Plan) -> dict[str, str | None]:
+    """Fingerprint the final value of each variable of the plan, without storing the values themselves."""
+    return {key: _digest(value) for key, value in plan.changes().items()}
+
+
+def _digest(value: str | None) -> str | None:
+    return None if value is None else hashlib.sha256(value.encode()).hexdigest()
+
+
+def _select_changed(config: pytest.Config, items: list[pytest.Item]) -> None:
+    """Deselect tests that did not read any variable whose value changed since the previous run."""
+    if (cache := _cache(config)) is None or (previous := cache.get(_PLAN_CACHE, None)) is None:
+        return
+    current = _plan_digests(config.stash[_plan_key])
+    if not (changed := {key for key in previous.keys() | current.keys() if previous.get(key) != current.get(key)}):
         return
+    reads = config.stash[_reads_key]
+    selected, deselected = [], []
+    for item in items:
+        if item.nodeid not in reads or changed.intersection(reads[item.nodeid]):
+            selected.append(item)
+        else:
+            deselected.append(item)
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
+
+
+def _skip_unmet_requirements(overlays: _Overlays, items: list[pytest.Item]) -> None:
+    """Evaluate ``requires_env`` markers once per distinct overlay and requirement set, skipping unmet tests."""
+    verdicts: dict[tuple[Overlay, tuple[Any, ...]], str | None] = {}
+    try:
+        for item in items:
+            if not (markers := list(item.iter_markers("requires_env"))):
+                continue
+            requirements = tuple((marker.args, tuple(sorted(marker.kwargs.items()))) for marker in markers)
+            if (key := (overlays.of(item), requirements)) not in verdicts:
+                overlays.activate(item)
+                verdicts[key] = _unmet_requirement(markers, os.environ)
+            if (reason := verdicts[key]) is not None:
+                item.add_marker(pytest.mark.skip(reason=reason))
+    finally:
+        overlays.restore()
+
+
+def _unmet_requirement(markers: list[pytest.Mark], environ: Mapping[str, str]) -> str | None:
+    """Describe the first requirement ``environ`` does not meet; a string must match, a callable must return true."""
+    for marker in markers:
+        for key in (*marker.args, *marker.kwargs):
+            if key not in environ:
+                return f"requires environment variable {key}"
+        for key, expected in marker.kwargs.items():
+            if callable(expected):
+                if not expected(environ[key]):
+                    name = getattr(expected, "__qualname__", repr(expected))  # partials and instances lack one
+                    return f"requires environment variable {key} to satisfy {name}"
+            elif environ[key] != expected:
+                return f"requires environment variable {key}={expected}"
+    return None
+
+
+class _EnvironTracker(dict[Any, Any]):  # ruff:ignore[subclass-builtin] # os.environ needs a real dict
+    """Storage behind ``os.environ`` that remembers the value each key had before its first change, and reads."""
 
-    for env_file_str in env_files or list(early_config.getini("env_files")):
-        if (resolved := early_config.rootpath / env_file_str).is_file():
-            yield resolved
+    def __init__(self, data: dict[Any, Any]) -> None:
+        super().__init__(data)
+        self.wrapped = data  # the storage this tracker replaces, possibly the tracker of an outer session
+        self.originals: dict[Any, Any] = {}
+        self.touched: set[Any] = set()  # keys changed since the last settle
+        self.reads: set[Any] | None = None  # keys looked up, while recording
+        self.suspended = 0
 
+    def __getitem__(self, key: object) -> Any:  # ruff:ignore[any-type]
+        if self.reads is not None and not self.suspended:
+            self.reads.add(key)
+        return super().__getitem__(key)
 
-def _load_values(early_config: pytest.Config) -> Iterator[Entry]:
-    """Load env entries from config, preferring TOML over INI."""
-    if toml_config := _find_toml_config(early_config):
-        _, entries, _ = _load_toml_config(toml_config)
-        if entries:
-            yield from entries
+    def _record(self, key: object) -> None:
+        if self.suspended:
             return
+        self.touched.add(key)
+        if key not in self.originals:
+            self.originals[key] = self.get(key)
+
+    def __setitem__(self, key: object, value: object) -> None:
+        self._record(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: object) -> None:
+        self._record(key)
+        super().__delitem__(key)
+
+    def settle(self) -> dict[str, bool]:
+        """Return whether each variable changed since the last call differs from its value before its first change."""
+        keys, self.touched = self.touched, set()
+        return {os.environ.decodekey(key): self.get(key) != self.originals[key] for key in keys}
+
+    def read(self) -> list[str]:
+        """Return the variables looked up while recording, and stop recording."""
+        keys, self.reads = self.reads or set(), None
+        return sorted(os.environ.decodekey(key) for key in keys)
+
+    def unwrap(self) -> dict[Any, Any]:
+        """Carry the changes made while tracking over to the storage this tracker replaced, and return it."""
+        wrapped = self.wrapped
+        for key in wrapped.keys() - self.keys():
+            del wrapped[key]
+        for key, value in self.items():
+            if wrapped.get(key) != value:
+                wrapped[key] = value
+        return wrapped
+
+
+@contextmanager
+def _untracked() -> Generator[None, None, None]:
+    """Do not report changes made by pytest-env itself as leaks."""
+    if not isinstance(data := os.environ._data, _EnvironTracker):  # ruff:ignore[private-member-access] # ty: ignore[unresolved-attribute]
+        yield
+        return
+    data.suspended += 1
+    try:
+        yield
+    finally:
+        data.suspended -= 1
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    """Register the markers and start tracking ``os.environ`` when leak detection or read tracking is requested."""
+    config.addinivalue_line("markers", "pytest_env(**values): set environment variables while the test runs")
+    config.addinivalue_line(
+        "markers",
+        "requires_env(*keys, **predicates): skip unless the variables are set and match the value or callable",
+    )
+    config.stash[_overlays_key] = _Overlays(config.stash.get(_nested_configs_key, None))
+    if report_path := config.getoption("pytest_env_matrix_report"):
+        config.pluginmanager.register(_MatrixReportWriter(config, Path(report_path)), "pytest-env-matrix-report")
+    if config.getoption("pytest_env_changed"):
+        config.stash[_reads_key] = dict(cache.get(_READS_CACHE, {})) if (cache := _cache(config)) else {}
+    if config.getoption("pytest_env_check_leaks") or _reads_key in config.stash:
+        tracker = _EnvironTracker(os.environ._data)  # ruff:ignore[private-member-access] # ty: ignore[unresolved-attribute]
+        os.environ._data = tracker  # ruff:ignore[private-member-access] # ty: ignore[unresolved-attribute]
+        config.stash[_tracker_key] = tracker
+
+
+def pytest_unconfigure(config: pytest.Config) -> None:
+    """Close secrets provider connections and stop tracking changes of ``os.environ``."""
+    close_providers()
+    if (tracker := config.stash.get(_tracker_key, None)) is not None:
+        os.environ._data = tracker.unwrap()  # ruff:ignore[private-member-access] # ty: ignore[unresolved-attribute]
+
+
+def pytest_terminal_summary(terminalreporter: pytest.TerminalReporter, config: pytest.Config) -> None:
+    """Report tests that changed environment variables without restoring them."""
+    if leaks := config.stash.get(_leaks_key, None):
+        terminalreporter.section("pytest-env leaked environment variables")
+        by_test: dict[str, list[str]] = {}
+        for key, nodeid in leaks.items():
+            by_test.setdefault(nodeid, []).append(key)
+        for nodeid, keys in by_test.items():
+            terminalreporter.line(f"{nodeid}: {', '.join(sorted(keys))}")
 
-    for line in early_config.getini("env"):
-        # INI lines e.g. D:R:NAME=VAL has two flags (R and D), NAME key, and VAL value
-        parts = line.partition("=")
-        ini_key_parts = parts[0].split(":")
-        flags = {k.strip().upper() for k in ini_key_parts[:-1]}
-        # R: is a way to designate whether to use raw value -> perform no transformation of the value
-        transform = "R" not in flags
-        # D: is a way to mark the value to be set only if it does not exist yet
-        skip_if_set = "D" in flags
-        # U: is a way to unset (remove) an environment variable
-        unset = "U" in flags
-        key = ini_key_parts[-1].strip()
-        value = parts[2].strip()
-        yield Entry(key, value, transform, skip_if_set, unset=unset)
-
-
-def _parse_toml_config(config: dict[str, Any]) -> Generator[Entry, None, None]:
-    for key, entry in config.items():
-        if key == "env_files" and isinstance(entry, list):
-            continue
-        if key == "env_files_skip_if_set" and isinstance(entry, bool):
-            continue
-        if isinstance(entry, dict):
-            unset = bool(entry.get("unset"))
-            value = str(entry.get("value", "")) if not unset else ""
-            transform, skip_if_set = bool(entry.get("transform")), bool(entry.get("skip_if_set"))
+
+def pytest_report_header(config: pytest.Config) -> list[str] | None:
+    """Display environment variable assignments in test session header."""
+    if _env_actions_key in config.stash:
+        return config.stash[_env_actions_key]
+    return None
+
+
+def _format_actions(actions: list[Action]) -> list[str]:
+    lines = ["pytest-env:"]
+    for action, key, value, source in actions:
+        if action == "UNSET":
+            lines.append(f"  {action:<5} {key}  (from {source})")
         else:
-            value, transform, skip_if_set, unset = str(entry), False, False, False
-        yield Entry(key, value, transform, skip_if_set, unset=unset)
+            lines.append(f"  {action:<5} {key}={value}  (from {source})")
+    return lines
@@ -0,0 +1,119 @@
+"""Secrets providers that resolve ``{ provider = "...", path = "..." }`` entries in one batch per provider."""
+
+from __future__ import annotations
+
+import http.client
+import json
+import socket
+from typing import TYPE_CHECKING, Protocol
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Mapping
+
+AGENT_ADDRESS_VAR = "PYTEST_ENV_SECRETS_AGENT"
+
+
+class SecretsProvider(Protocol):
+    """Source of secret values."""
+
+    def fetch(self, requests: Mapping[str, str]) -> Mapping[str, str]:
+        """Return the value of every requested variable, given a mapping of variable names to secret paths."""
+        ...  # pragma: no cover
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str) -> None:
+        super().__init__("localhost")
+        self._socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self._socket_path)
+
+
+class AgentProvider:
+    """
+    Fetch secrets from a local agent over HTTP or a Unix socket.
+
+    All variables are requested with a single ``POST /v1/secrets`` carrying ``{"secrets": {NAME: PATH}}`` and the agent
+    answers with ``{"secrets": {NAME: VALUE}}``. The connection is kept open and reused for later batches.
+    """
+
+    def __init__(self, address: str) -> None:
+        """Connect lazily to ``http://host:port`` or ``unix:///path/to/socket``."""
+        parsed = urlsplit(address)
+        if parsed.scheme == "unix":
+            self._connection: http.client.HTTPConnection = _UnixHTTPConnection(parsed.path)
+        elif parsed.scheme == "http":
+            self._connection = http.client.HTTPConnection(parsed.hostname or "localhost", parsed.port)
+        else:
+            msg = f"Unsupported secrets agent address: {address}"
+            raise ValueError(msg)
+
+    def fetch(self, requests: Mapping[str, str]) -> Mapping[str, str]:
+        """Request all secrets in one round-trip."""
+        body = json.dumps({"secrets": dict(requests)})
+        try:
+            status, data = self._post(body)
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            self._connection.close()  # the agent dropped the idle connection, retry once on a fresh one
+            status, data = self._post(body)
+        if status != http.client.OK:
+            msg = f"Secrets agent answered {status}: {data.decode(errors='replace')}"
+            raise RuntimeError(msg)
+        return json.loads(data)["secrets"]
+
+    def _post(self, body: str) -> tuple[int, bytes]:
+        self._connection.request("POST", "/v1/secrets", body=body, headers={"Content-Type": "application/json"})
+        response = self._connection.getresponse()
+        return response.status, response.read()
+
+    def close(self) -> None:
+        """Close the pooled connection."""
+        self._connection.close()
+
+
+def _agent_provider(environ: Mapping[str, str]) -> SecretsProvider:
+    if not (address := environ.get(AGENT_ADDRESS_VAR)):
+        msg = f"Set {AGENT_ADDRESS_VAR} to the address of the secrets agent"
+        raise LookupError(msg)
+    return AgentProvider(address)
+
+
+_factories: dict[str, Callable[[Mapping[str, str]], SecretsProvider]] = {"agent": _agent_provider}
+_instances: dict[str, SecretsProvider] = {}
+
+
+def register_provider(name: str, factory: Callable[[Mapping[str, str]], SecretsProvider]) -> None:
+    """Make ``provider = name`` entries resolve through the provider built by ``factory`` from the environment."""
+    _factories[name] = factory
+    _instances.pop(name, None)
+
+
+def get_provider(name: str, environ: Mapping[str, str]) -> SecretsProvider:
+    """Return the provider registered as ``name``, creating it on first use and reusing it afterwards."""
+    if (provider := _instances.get(name)) is None:
+        if (factory := _factories.get(name)) is None:
+            msg = f"Unknown secrets provider: {name}"
+            raise LookupError(msg)
+        provider = _instances[name] = factory(environ)
+    return provider
+
+
+def close_providers() -> None:
+    """Close the pooled connections of the providers created so far and forget them."""
+    for provider in _instances.values():
+        if callable(close := getattr(provider, "close", None)):
+            close()
+    _instances.clear()
+
+
+__all__ = [
+    "AGENT_ADDRESS_VAR",
+    "AgentProvider",
+    "SecretsProvider",
+    "close_providers",
+    "get_provider",
+    "register_provider",
+]
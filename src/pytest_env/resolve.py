@@ -0,0 +1,785 @@
+"""Discover, parse and resolve the pytest-env configuration, without depending on pytest itself."""
+
+from __future__ import annotations
+
+import atexit
+import bz2
+import gzip
+import io
+import lzma
+import os
+import re
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+import uuid
+from collections import ChainMap
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import chain, repeat
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, NamedTuple, Protocol
+
+from dotenv import dotenv_values
+
+from .encryption import ENCRYPTED_SUFFIX, decrypt_env_file
+from .providers import get_provider
+
+if TYPE_CHECKING:
+    import argparse
+    from collections.abc import Callable, Generator, Iterable, Iterator, Mapping, Sequence
+
+
+class EarlyConfig(Protocol):
+    """The parts of ``pytest.Config`` that environment resolution reads, so it can also run outside of pytest."""
+
+    @property
+    def rootpath(self) -> Path:
+        """Directory relative to which configured files are resolved."""
+
+    @property
+    def inipath(self) -> Path | None:
+        """Configuration file pytest settings were read from, if any."""
+
+    @property
+    def known_args_namespace(self) -> argparse.Namespace:
+        """Parsed command line options (``envfile`` and ``envdirs``)."""
+
+    def getini(self, name: str) -> Any:  # ruff:ignore[any-type] # mirrors pytest.Config.getini
+        """Value of an INI setting."""
+
+
+if sys.version_info >= (3, 11):  # pragma: >=3.11 cover
+    import tomllib
+else:  # pragma: <3.11 cover
+    import tomli as tomllib
+
+
+_TRANSFORM, _SKIP_IF_SET, _UNSET, _PRIVATE = 1, 2, 4, 8
+_FLAGS = {"transform": _TRANSFORM, "skip_if_set": _SKIP_IF_SET, "unset": _UNSET, "private": _PRIVATE}
+
+
+class Entry:
+    """
+    Configuration entries.
+
+    Generated configurations can hold tens of thousands of entries, so they carry no ``__dict__``, pack their flags
+    into one integer and intern their keys.
+    """
+
+    __slots__ = ("_flags", "generate", "key", "path", "provider", "value")
+
+    def __init__(  # ruff:ignore[too-many-arguments, too-many-positional-arguments]
+        self,
+        key: str,
+        value: str,
+        transform: bool,  # ruff:ignore[boolean-type-hint-positional-argument]
+        skip_if_set: bool,  # ruff:ignore[boolean-type-hint-positional-argument]
+        unset: bool = False,  # ruff:ignore[boolean-type-hint-positional-argument, boolean-default-value-positional-argument]
+        private: bool = False,  # ruff:ignore[boolean-type-hint-positional-argument, boolean-default-value-positional-argument]
+        provider: str | None = None,  # name of the secrets provider resolving the value
+        path: str = "",  # secret path passed to the provider
+        generate: str | None = None,  # name of the generator producing the value once per process
+    ) -> None:
+        """Create an entry, with the same arguments as the keys of a TOML entry table."""
+        flags = (transform and _TRANSFORM) | (skip_if_set and _SKIP_IF_SET) | (unset and _UNSET)
+        self._init(key, value, flags | (private and _PRIVATE), provider, path, generate)
+
+    def _init(  # ruff:ignore[too-many-arguments, too-many-positional-arguments]
+        self, key: str, value: str, flags: int, provider: str | None, path: str, generate: str | None
+    ) -> None:
+        self.key = sys.intern(key)
+        self.value = value
+        self._flags = flags
+        self.provider = provider
+        self.path = path
+        self.generate = generate
+
+    @classmethod
+    def _from_flags(cls, key: str, value: str, flags: int) -> Entry:
+        entry = cls.__new__(cls)
+        entry._init(key, value, flags, None, "", None)  # ruff:ignore[private-member-access]
+        return entry
+
+    @property
+    def transform(self) -> bool:
+        """Expand ``{VAR}`` references in the value."""
+        return bool(self._flags & _TRANSFORM)
+
+    @property
+    def skip_if_set(self) -> bool:
+        """Keep the variable when it is already set."""
+        return bool(self._flags & _SKIP_IF_SET)
+
+    @property
+    def unset(self) -> bool:
+        """Remove the variable instead of setting it."""
+        return bool(self._flags & _UNSET)
+
+    @property
+    def private(self) -> bool:
+        """Only available to ``{VAR}`` expansion of later entries, never exported."""
+        return bool(self._flags & _PRIVATE)
+
+    def with_value(self, value: str) -> Entry:
+        """Copy of the entry assigning ``value`` instead."""
+        entry = Entry.__new__(Entry)
+        entry._init(self.key, value, self._flags, self.provider, self.path, self.generate)  # ruff:ignore[private-member-access]
+        return entry
+
+    def _astuple(self) -> tuple[str, str, int, str | None, str, str | None]:
+        return self.key, self.value, self._flags, self.provider, self.path, self.generate
+
+    def __eq__(self, other: object) -> bool:
+        """Entries are equal when all their fields are."""
+        if not isinstance(other, Entry):
+            return NotImplemented
+        return self._astuple() == other._astuple()
+
+    __hash__ = None  # entries are mutable
+
+    def __repr__(self) -> str:
+        """Show the key, value and flags, plus the provider and generator settings in use."""
+        flags = ", ".join(f"{name}={bool(self._flags & flag)}" for name, flag in _FLAGS.items())
+        extra = "".join(
+            f", {name}={value!r}"
+            for name, value in (("provider", self.provider), ("path", self.path), ("generate", self.generate))
+            if value
+        )
+        return f"Entry(key={self.key!r}, value={self.value!r}, {flags}{extra})"
+
+
+class Action(NamedTuple):
+    """A single resolved environment change, also used for verbose reporting."""
+
+    action: str  # SET, SKIP, UNSET or PRIV
+    key: str
+    value: str
+    source: str
+
+
+@dataclass
+class Plan:
+    """Environment changes resolved from the configuration, applied to ``os.environ`` in one batch."""
+
+    actions: list[Action] = field(default_factory=list)
+    nested_root: Path | None = None
+    generated: bool = False  # holds per-process values, so it must not be reused by other processes
+    inputs: dict[str, str | None] = field(default_factory=dict)  # variables of os.environ read, None when unset
+
+    def changes(self) -> dict[str, str | None]:
+        """Compute the final value of every changed variable, ``None`` for variables that are unset."""
+        final: dict[str, str | None] = {}
+        for action in self.actions:
+            if action.action == "SET":
+                final[action.key] = action.value
+            elif action.action == "UNSET":
+                final[action.key] = None
+        return final
+
+    def apply(self) -> None:
+        """Write the final value of every changed variable to ``os.environ``."""
+        for key, value in self.changes().items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class _PlannedEnviron(MutableMapping[str, str]):
+    """View of ``os.environ`` with the changes planned so far layered on top, without writing them."""
+
+    def __init__(self, inputs: dict[str, str | None]) -> None:
+        self.changes: dict[str, str | None] = {}
+        self.inputs = inputs
+
+    def original(self, key: str) -> str | None:
+        """Value of ``key`` in ``os.environ``, before the planned changes, remembered as an input of the plan."""
+        if key not in self.inputs:
+            self.inputs[key] = os.environ.get(key)
+        return self.inputs[key]
+
+    def __getitem__(self, key: str) -> str:
+        if (value := self.changes[key] if key in self.changes else self.original(key)) is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: str) -> None:
+        self.changes[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self.changes[key] = None
+
+    def __iter__(self) -> Iterator[str]:
+        yield from (key for key in os.environ if key not in self.changes)
+        yield from (key for key, value in self.changes.items() if value is not None)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+def _resolve_plan(
+    early_config: EarlyConfig, toml_path: Path | None, envfile: str | None, extra: Sequence[Entry] = ()
+) -> tuple[Plan, list[Path]]:
+    """Resolve the environment changes of the configuration and ``extra`` entries, along with the files they use."""
+    toml_config = _load_toml_config(toml_path) if toml_path else TomlConfig()
+    env_files_list = toml_config.env_files
+    sources = [path for path in (early_config.inipath, *toml_config.layers) if path is not None]
+    sources.extend(early_config.rootpath / env_file for env_file in env_files_list or early_config.getini("env_files"))
+    if envfile:
+        sources.append(early_config.rootpath / envfile.removeprefix("+"))
+    private_files = toml_config.env_files_private or list(early_config.getini("env_files_private"))
+    sources.extend(early_config.rootpath / env_file for env_file in private_files)
+    env_dirs = _load_env_dirs(early_config, toml_config.env_dirs)
+    sources.extend(env_dirs)  # files added or removed
+    sources.extend(path for env_dir in env_dirs for path in _env_dir_files(env_dir))  # files edited in place
+
+    env_files_skip_if_set = toml_config.env_files_skip_if_set
+    if env_files_skip_if_set is None:
+        env_files_skip_if_set = bool(early_config.getini("env_files_skip_if_set"))
+
+    plan = Plan()
+    environ = _PlannedEnviron(plan.inputs)
+    _apply_env_files(
+        early_config,
+        env_files_list,
+        environ,
+        plan.actions,
+        envfile=envfile,
+        env_dirs=env_dirs,
+        skip_if_set=env_files_skip_if_set,
+    )
+    private = _load_private_files(early_config.rootpath, private_files, environ)
+    _apply_entries(early_config, environ, plan, private, extra)
+
+    nested_configs = toml_config.nested_configs
+    if nested_configs is None:
+        nested_configs = bool(early_config.getini("env_nested_configs"))
+    if nested_configs:
+        start_path = early_config.inipath.parent if early_config.inipath is not None else early_config.rootpath
+        plan.nested_root = toml_path.parent if toml_path else start_path
+    return plan, sources
+
+
+def _apply_env_files(  # ruff:ignore[too-many-arguments]
+    early_config: EarlyConfig,
+    env_files_list: list[str],
+    environ: _PlannedEnviron,
+    actions: list[Action],
+    *,
+    envfile: str | None = None,
+    env_dirs: Iterable[Path] = (),
+    skip_if_set: bool = False,
+) -> None:
+    env_files = (
+        (env_file, _read_env_file(env_file, environ))
+        for env_file in _load_env_files(early_config, env_files_list, envfile)
+    )
+    for source, values in chain(env_files, ((env_dir, _read_env_dir(env_dir)) for env_dir in env_dirs)):
+        for key, value in values.items():
+            if value is not None:
+                if skip_if_set and (existing := environ.original(key)) is not None:
+                    actions.append(Action("SKIP", key, existing, str(source)))
+                else:
+                    environ[key] = value
+                    actions.append(Action("SET", key, value, str(source)))
+
+
+def _apply_entries(
+    early_config: EarlyConfig,
+    environ: MutableMapping[str, str],
+    plan: Plan,
+    private: dict[str, str],
+    extra: Sequence[Entry] = (),
+) -> None:
+    actions = plan.actions
+    labelled = chain(
+        zip(repeat(_config_source(early_config)), _with_secrets(_load_values(early_config), environ)),
+        zip(repeat("plugin"), _with_secrets(extra, environ)),
+    )
+    scope = ChainMap(private, environ)
+    for source, entry in labelled:
+        plan.generated |= entry.generate is not None
+        if entry.unset:
+            private.pop(entry.key, None)
+            environ.pop(entry.key, None)
+            actions.append(Action("UNSET", entry.key, "", source))
+        elif entry.skip_if_set and entry.key in scope:
+            actions.append(Action("SKIP", entry.key, scope[entry.key], source))
+        elif entry.private:
+            private[entry.key] = final = _entry_value(entry, scope)
+            actions.append(Action("PRIV", entry.key, final, source))
+        else:
+            final = _entry_value(entry, scope)
+            private.pop(entry.key, None)  # later references must see the exported value
+            environ[entry.key] = final
+            actions.append(Action("SET", entry.key, final, source))
+
+
+def _load_private_files(
+    base: Path, env_files: Iterable[str], environ: MutableMapping[str, str] = os.environ
+) -> dict[str, str]:
+    """Read the template-only variables of private ``.env`` files, resolved relative to ``base``."""
+    private: dict[str, str] = {}
+    scope = ChainMap(private, environ)
+    for env_file_str in env_files:
+        if (env_file := base / env_file_str).is_file():
+            values = _read_env_file(env_file, scope)
+            private.update((key, value) for key, value in values.items() if value is not None)
+    return private
+
+
+def _file_signature(path: str) -> list[int] | None:
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _with_secrets(entries: Iterable[Entry], environ: Mapping[str, str]) -> Iterator[Entry]:
+    """
+    Fill in the values of provider entries, fetching them in one batch per provider.
+
+    Entries stream through until the first provider entry; from there on they wait for the batches to be fetched.
+    """
+    pending: list[Entry] = []
+    for entry in entries:
+        if pending or entry.provider is not None:
+            pending.append(entry)
+        else:
+            yield entry
+    batches: dict[str, dict[str, str]] = {}
+    for entry in pending:
+        if entry.provider is not None:
+            batches.setdefault(entry.provider, {})[entry.key] = entry.path
+    fetched = {name: get_provider(name, environ).fetch(requests) for name, requests in batches.items()}
+    for entry in pending:
+        if entry.provider is None:
+            yield entry
+        elif (value := fetched[entry.provider].get(entry.key)) is not None:
+            yield entry.with_value(value)
+        else:
+            msg = f"Secrets provider {entry.provider} returned no value for {entry.key}"
+            raise LookupError(msg)
+
+
+def _entry_value(entry: Entry, environ: Mapping[str, str] = os.environ) -> str:
+    """Compute the value an entry assigns, expanding ``{VAR}`` references when requested."""
+    if entry.generate is not None:
+        return _generate(entry.key, entry.generate)
+    return entry.value.format_map(environ) if entry.transform else entry.value
+
+
+_generated: dict[tuple[str, str], str] = {}
+
+
+def _generate(key: str, generator: str) -> str:
+    """Produce the value of a ``generate`` entry, once per process."""
+    if (value := _generated.get((key, generator))) is None:
+        if (factory := _GENERATORS.get(generator)) is None:
+            msg = f"Unknown generator {generator!r} for {key}, expected one of: {', '.join(sorted(_GENERATORS))}"
+            raise ValueError(msg)
+        value = _generated[key, generator] = factory(key)
+    return value
+
+
+_PORT_ALLOCATIONS = Path(tempfile.gettempdir()) / f"pytest-env-ports-{os.getuid() if hasattr(os, 'getuid') else 0}"
+_PORT_ATTEMPTS = 100
+
+
+def _free_port(key: str) -> str:
+    """
+    Pick a free local TCP port and reserve it through an allocation file, so concurrent workers never share one.
+
+    When the allocation directory of the user cannot be used, the port is returned without a reservation.
+    """
+    allocations = _port_allocations()
+    for _ in range(_PORT_ATTEMPTS):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        if allocations is None:
+            return str(port)
+        allocation = allocations / str(port)
+        if _allocation_stale(allocation):
+            allocation.unlink(missing_ok=True)
+        try:
+            fd = os.open(allocation, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            continue
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(str(os.getpid()))
+        atexit.register(allocation.unlink, missing_ok=True)
+        return str(port)
+    msg = f"Could not reserve a free port for {key} in {_PORT_ATTEMPTS} attempts"
+    raise RuntimeError(msg)
+
+
+def _port_allocations() -> Path | None:
+    """Create the allocation directory, refusing to use it when it is not a directory of the current user."""
+    try:
+        _PORT_ALLOCATIONS.mkdir(mode=0o700, exist_ok=True)
+        info = _PORT_ALLOCATIONS.lstat()
+    except OSError:
+        return None
+    if not stat.S_ISDIR(info.st_mode) or (hasattr(os, "getuid") and info.st_uid != os.getuid()):
+        return None
+    return _PORT_ALLOCATIONS
+
+
+def _allocation_stale(allocation: Path) -> bool:
+    """Check whether a port allocation file was left behind by a process that no longer runs."""
+    try:
+        pid = int(allocation.read_text(encoding="utf-8"))
+    except (OSError, ValueError):  # missing, or still being written
+        return False
+    if os.name != "posix":  # pragma: posix no cover # signal 0 is not a liveness probe on Windows
+        return False
+    try:  # pragma: posix cover
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+def _temporary_directory(key: str) -> str:
+    path = tempfile.mkdtemp(prefix=f"pytest-env-{key.lower()}-")
+    atexit.register(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+
+_GENERATORS: dict[str, Callable[[str], str]] = {
+    "free_port": _free_port,
+    "tmpdir": _temporary_directory,
+    "uuid": lambda _key: str(uuid.uuid4()),
+}
+
+
+def _find_toml_config(early_config: EarlyConfig) -> Path | None:
+    """Find TOML config file by checking inipath first, then walking up the tree."""
+    if (
+        early_config.inipath
+        and early_config.inipath.suffix == ".toml"
+        and early_config.inipath.name in {"pytest.toml", ".pytest.toml", "pyproject.toml"}
+    ):
+        return early_config.inipath
+
+    start_path = early_config.inipath.parent if early_config.inipath is not None else early_config.rootpath
+    for current_path in [start_path, *start_path.parents]:
+        for toml_name in ("pytest.toml", ".pytest.toml", "pyproject.toml"):
+            toml_file = current_path / toml_name
+            if toml_file.exists():
+                return toml_file
+    return None
+
+
+def _config_source(early_config: EarlyConfig) -> str:
+    """Describe the configuration source for verbose output."""
+    if (toml_path := _find_toml_config(early_config)) and _load_toml_config(toml_path).entries:
+        return str(toml_path)
+    if early_config.inipath:
+        return str(early_config.inipath)
+    return "config"  # pragma: no cover
+
+
+@dataclass
+class TomlConfig:
+    """Settings and entries of a native ``pytest_env`` TOML section."""
+
+    env_files: list[str] = field(default_factory=list)
+    env_files_private: list[str] = field(default_factory=list)
+    env_dirs: list[str] = field(default_factory=list)
+    entries: list[Entry] = field(default_factory=list)
+    env_files_skip_if_set: bool | None = None
+    nested_configs: bool | None = None
+    layers: list[Path] = field(default_factory=list, compare=False)  # files merged into this config, root first
+
+
+_toml_configs: dict[Path, tuple[list[tuple[Path, list[int] | None]], TomlConfig]] = {}
+
+
+def _load_toml_config(config_path: Path, _extending: tuple[Path, ...] = ()) -> TomlConfig:
+    """Load env_files and entries from TOML config file, layered over the configs it ``extends`` (memoized)."""
+    config_path = config_path.resolve()
+    if config_path in _extending:
+        chain = " -> ".join(str(path) for path in (*_extending, config_path))
+        msg = f"Circular extends in pytest_env configuration: {chain}"
+        raise ValueError(msg)
+    if (cached := _toml_configs.get(config_path)) is not None:
+        signatures, config = cached
+        if all(_file_signature(str(path)) == signature for path, signature in signatures):
+            return config
+
+    signature = _file_signature(str(config_path))
+    config, extends = _parse_toml_file(config_path)
+    if extends is not None:
+        if not (base_path := config_path.parent / extends).is_file():
+            msg = f"Extended configuration not found: {extends} (from {config_path})"
+            raise FileNotFoundError(msg)
+        config = _merge_toml_configs(_load_toml_config(base_path, (*_extending, config_path)), config)
+    signatures = [(path, signature if path == config_path else _file_signature(str(path))) for path in config.layers]
+    _toml_configs[config_path] = signatures, config
+    return config
+
+
+def _merge_toml_configs(base: TomlConfig, layer: TomlConfig) -> TomlConfig:
+    """Layer ``layer`` over ``base``: entries override by key, env files of ``base`` stay relative to its file."""
+    base_dir = base.layers[-1].parent
+    overridden = {entry.key for entry in layer.entries}
+    skip_if_set, nested_configs = layer.env_files_skip_if_set, layer.nested_configs
+    return TomlConfig(
+        env_files=[*(str(base_dir / name) for name in base.env_files), *layer.env_files],
+        env_files_private=[*(str(base_dir / name) for name in base.env_files_private), *layer.env_files_private],
+        env_dirs=[*(str(base_dir / name) for name in base.env_dirs), *layer.env_dirs],
+        entries=[*(entry for entry in base.entries if entry.key not in overridden), *layer.entries],
+        env_files_skip_if_set=base.env_files_skip_if_set if skip_if_set is None else skip_if_set,
+        nested_configs=base.nested_configs if nested_configs is None else nested_configs,
+        layers=[*base.layers, *layer.layers],
+    )
+
+
+def _parse_toml_file(config_path: Path) -> tuple[TomlConfig, str | None]:
+    """Parse the ``pytest_env`` section of a single TOML file, along with the path it extends."""
+    text = config_path.read_bytes().decode()
+    table = "tool.pytest_env" if config_path.name == "pyproject.toml" else "pytest_env"
+    if (config := _extract_toml_table(text, table)) is None:
+        config = tomllib.loads(text)
+
+    if config_path.name == "pyproject.toml":
+        config = config.get("tool", {})
+
+    pytest_env_config = config.get("pytest_env", {})
+    if not pytest_env_config:
+        return TomlConfig(layers=[config_path]), None
+
+    raw_env_files = pytest_env_config.get("env_files")
+    env_files = [str(f) for f in raw_env_files] if isinstance(raw_env_files, list) else []
+    raw_private_files = pytest_env_config.get("env_files_private")
+    env_files_private = [str(f) for f in raw_private_files] if isinstance(raw_private_files, list) else []
+    raw_env_dirs = pytest_env_config.get("env_dirs")
+    env_dirs = [str(d) for d in raw_env_dirs] if isinstance(raw_env_dirs, list) else []
+    raw_skip = pytest_env_config.get("env_files_skip_if_set")
+    raw_nested = pytest_env_config.get("env_nested_configs")
+    raw_extends = pytest_env_config.get("extends")
+
+    return TomlConfig(
+        env_files=env_files,
+        env_files_private=env_files_private,
+        env_dirs=env_dirs,
+        entries=list(_parse_toml_config(pytest_env_config)),
+        env_files_skip_if_set=raw_skip if isinstance(raw_skip, bool) else None,
+        nested_configs=raw_nested if isinstance(raw_nested, bool) else None,
+        layers=[config_path],
+    ), raw_extends if isinstance(raw_extends, str) else None
+
+
+_TOML_HEADER = re.compile(r"^[ \t]*\[\[?([^\[\]\n]+)\]\]?[ \t\r]*(?:#.*)?$", re.MULTILINE)
+
+
+def _extract_toml_table(text: str, table: str) -> dict[str, Any] | None:
+    """
+    Parse only ``table`` and its sub-tables out of a TOML document.
+
+    Returns ``None`` when the layout is ambiguous (multi-line strings, dotted or inline definitions, quoted table names,
+    or no table headers at all) so the caller can fall back to parsing the whole document.
+    """
+    if '"""' in text or "'''" in text or not (headers := list(_TOML_HEADER.finditer(text))):
+        return None
+    if "pytest_env" not in text:
+        return {}
+    chunks: list[str] = []
+    for index, header in enumerate(headers):
+        name = header[1].replace(" ", "").replace("\t", "")
+        if name == table or name.startswith(f"{table}."):
+            end = headers[index + 1].start() if index + 1 < len(headers) else len(text)
+            chunks.append(text[header.start() : end])
+        elif "pytest_env" in name:
+            return None
+    section = "".join(chunks)
+    if section.count("pytest_env") != text.count("pytest_env"):
+        return None
+    try:
+        return tomllib.loads(section)
+    except tomllib.TOMLDecodeError:
+        return None
+
+
+_COMPRESSED_FORMATS: tuple[tuple[bytes, Callable[..., IO[str]]], ...] = (
+    (b"\x1f\x8b", gzip.open),
+    (b"BZh", bz2.open),
+    (b"\xfd7zXZ\x00", lzma.open),
+)
+
+
+def _read_env_file(env_file: Path, environ: Mapping[str, str] = os.environ) -> dict[str, str | None]:
+    """
+    Parse a ``.env`` file, expanding ``${VAR}`` references against its own earlier values, then ``environ``.
+
+    Files ending in ``.enc`` are decrypted first, gzip, bzip2 and xz files (detected by magic bytes) are decompressed
+    as a stream.
+    """
+    if env_file.suffix == ENCRYPTED_SUFFIX:
+        return _parse_env_stream(io.StringIO(decrypt_env_file(env_file, environ)), environ)
+    with env_file.open("rb") as raw:
+        magic = raw.read(6)
+        raw.seek(0)
+        opener = next((opener for prefix, opener in _COMPRESSED_FORMATS if magic.startswith(prefix)), None)
+        with opener(raw, "rt", encoding="utf-8") if opener else io.TextIOWrapper(raw, encoding="utf-8") as stream:
+            return _parse_env_stream(stream, environ)
+
+
+_VARIABLE = re.compile(r"\$\{(?P<name>[^\}:]*)(?::-(?P<default>[^\}]*))?\}")  # as expanded by python-dotenv
+
+
+def _parse_env_stream(stream: IO[str], environ: Mapping[str, str] = os.environ) -> dict[str, str | None]:
+    """
+    Parse ``.env`` content, expanding ``${VAR}`` and ``${VAR:-default}`` references the way python-dotenv does.
+
+    python-dotenv copies ``os.environ`` and all earlier values for every line it expands, which is quadratic in the size
+    of the file, so it only parses and references are looked up in the values read so far, then ``environ``. A key
+    assigned more than once is expanded with its last value.
+    """
+    values: dict[str, str | None] = {}
+    expand = partial(_expand, values, environ)
+    for key, value in dotenv_values(stream=stream, interpolate=False).items():
+        values[key] = value if value is None or "$" not in value else _VARIABLE.sub(expand, value)
+    return values
+
+
+def _expand(values: Mapping[str, str | None], environ: Mapping[str, str], match: re.Match[str]) -> str:
+    name, default = match["name"], match["default"] or ""
+    return (values[name] if name in values else environ.get(name, default)) or ""  # a key without value is empty
+
+
+def _load_env_files(
+    early_config: EarlyConfig, env_files: list[str], cli_envfile: str | None
+) -> Generator[Path, None, None]:
+    """Resolve and yield existing env files, with CLI option taking precedence."""
+    if cli_envfile:
+        if cli_envfile.startswith("+"):
+            if not (resolved := early_config.rootpath / cli_envfile[1:]).is_file():
+                msg = f"Environment file not found: {cli_envfile[1:]}"
+                raise FileNotFoundError(msg)
+            for env_file_str in env_files or list(early_config.getini("env_files")):
+                if (config_resolved := early_config.rootpath / env_file_str).is_file():
+                    yield config_resolved
+            yield resolved
+        else:
+            if not (resolved := early_config.rootpath / cli_envfile).is_file():
+                msg = f"Environment file not found: {cli_envfile}"
+                raise FileNotFoundError(msg)
+            yield resolved
+        return
+
+    for env_file_str in env_files or list(early_config.getini("env_files")):
+        if (resolved := early_config.rootpath / env_file_str).is_file():
+            yield resolved
+
+
+def _load_env_dirs(early_config: EarlyConfig, env_dirs: list[str]) -> list[Path]:
+    """Resolve the existing configured env directories, followed by the ones given on the command line."""
+    resolved = [
+        env_dir
+        for env_dir_str in env_dirs or list(early_config.getini("env_dirs"))
+        if (env_dir := early_config.rootpath / env_dir_str).is_dir()
+    ]
+    for cli_envdir in getattr(early_config.known_args_namespace, "envdirs", None) or []:
+        if not (env_dir := early_config.rootpath / cli_envdir).is_dir():
+            msg = f"Environment directory not found: {cli_envdir}"
+            raise FileNotFoundError(msg)
+        resolved.append(env_dir)
+    return resolved
+
+
+_ENV_DIR_PARALLEL_READS = 64  # read directories with more files than this from a thread pool
+
+
+def _read_env_dir(env_dir: Path) -> dict[str, str]:
+    """Read a directory of one file per variable, skipping dotfiles and binary files, stripping trailing newlines."""
+    paths = _env_dir_files(env_dir)
+    if len(paths) > _ENV_DIR_PARALLEL_READS:
+        with ThreadPoolExecutor() as executor:
+            contents = list(executor.map(_read_env_dir_file, paths))
+    else:
+        contents = [_read_env_dir_file(path) for path in paths]
+    return {
+        path.name: content.rstrip("\r\n") for path, content in zip(paths, contents, strict=True) if content is not None
+    }
+
+
+def _env_dir_files(env_dir: Path) -> list[Path]:
+    with os.scandir(env_dir) as entries:
+        return sorted(Path(entry.path) for entry in entries if not entry.name.startswith(".") and entry.is_file())
+
+
+def _read_env_dir_file(path: Path) -> str | None:
+    try:
+        return path.read_text(encoding="utf-8")
+    except UnicodeDecodeError:  # binary content, such as a keystore, cannot be the value of a variable
+        return None
+
+
+def _load_values(early_config: EarlyConfig) -> Iterator[Entry]:
+    """Load env entries from config, preferring TOML over INI."""
+    if (toml_config := _find_toml_config(early_config)) and (entries := _load_toml_config(toml_config).entries):
+        yield from entries
+        return
+
+    for line in early_config.getini("env"):
+        # INI lines e.g. D:R:NAME=VAL has two flags (R and D), NAME key, and VAL value
+        name, _, value = line.partition("=")
+        *ini_flags, key = name.split(":")
+        marks = 0
+        for flag in ini_flags:
+            marks |= _INI_FLAGS.get(flag.strip().upper(), 0)
+        # R marks a raw value, so it clears the transform flag every other entry starts with
+        yield Entry._from_flags(key.strip(), value.strip(), marks ^ _TRANSFORM)  # ruff:ignore[private-member-access]
+
+
+# R: raw value -> perform no transformation of the value
+# D: set only if the variable does not exist yet
+# U: unset (remove) the environment variable
+# P: private value, only used to expand later values and never exported
+_INI_FLAGS = {"R": _TRANSFORM, "D": _SKIP_IF_SET, "U": _UNSET, "P": _PRIVATE}
+
+
+def _parse_toml_config(config: dict[str, Any]) -> Generator[Entry, None, None]:
+    for key, entry in config.items():
+        if key in {"env_files", "env_files_private", "env_dirs"} and isinstance(entry, list):
+            continue
+        if key in {"env_files_skip_if_set", "env_nested_configs"} and isinstance(entry, bool):
+            continue
+        if key == "extends" and isinstance(entry, str):
+            continue
+        provider, path, generate = None, "", None
+        if isinstance(entry, dict):
+            unset = bool(entry.get("unset"))
+            value = str(entry.get("value", "")) if not unset else ""
+            transform, skip_if_set = bool(entry.get("transform")), bool(entry.get("skip_if_set"))
+            private = bool(entry.get("private"))
+            if "provider" in entry:
+                provider, path = str(entry["provider"]), str(entry.get("path", key))
+            if "generate" in entry:
+                generate = str(entry["generate"])
+        else:
+            value, transform, skip_if_set, unset, private = str(entry), False, False, False, False
+        yield Entry(
+            key,
+            value,
+            transform,
+            skip_if_set,
+            unset=unset,
+            private=private,
+            provider=provider,
+            path=path,
+            generate=generate,
+        )
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import os
+from textwrap import dedent
+from typing import TYPE_CHECKING
+from unittest import mock
+
+if TYPE_CHECKING:
+    import pytest
+
+
+def test_changed_selects_tests_reading_changed_variables(pytester: pytest.Pytester) -> None:
+    pytester.makefile(".toml", pytest='[pytest_env]\nenv_files = [".env"]')
+    pytester.makepyfile(
+        test_it=dedent("""\
+            import os
+
+            def test_item():
+                assert os.environ["ITEM"]
+
+            def test_getenv():
+                assert os.getenv("OTHER")
+
+            def test_contains():
+                assert "LATER" not in os.environ or os.environ["LATER"] == "set"
+
+            def test_reads_nothing():
+                pass
+        """)
+    )
+    env_file = pytester.path / ".env"
+
+    def run(content: str, *args: str) -> pytest.RunResult:
+        env_file.write_text(content, encoding="utf-8")
+        new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+        with mock.patch.dict(os.environ, new_env, clear=True):
+            return pytester.runpytest("--pytest-env-changed", *args)
+
+    run("ITEM=1\nOTHER=1").assert_outcomes(passed=4)
+    run("ITEM=1\nOTHER=1").assert_outcomes(passed=4)
+    run("ITEM=2\nOTHER=1").assert_outcomes(passed=1, deselected=3)
+    run("ITEM=2\nOTHER=1\nLATER=set").assert_outcomes(passed=1, deselected=3)
+    run("ITEM=2\nLATER=set\nOTHER=2").assert_outcomes(passed=1, deselected=3)
+    run("ITEM=3\nLATER=set\nOTHER=2", "-k", "test_item").assert_outcomes(passed=1, deselected=3)
+
+
+def test_changed_without_cache_runs_everything(pytester: pytest.Pytester) -> None:
+    pytester.makefile(".toml", pytest='[pytest_env]\nITEM = "1"')
+    pytester.makepyfile(test_it="def test_it():\n    pass")
+
+    new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest("--pytest-env-changed", "-p", "no:cacheprovider")
+
+    result.assert_outcomes(passed=1)
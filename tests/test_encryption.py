@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import argparse
+import errno
+import os
+import stat
+import sys
+from pathlib import Path
+from textwrap import dedent
+from typing import TYPE_CHECKING
+from unittest import mock
+
+import pytest
+from cryptography.fernet import Fernet
+
+from pytest_env import encryption
+from pytest_env.__main__ import StandaloneConfig
+from pytest_env.encryption import KEY_FILE_VAR, KEY_VAR, decrypt_env_file
+from pytest_env.resolve import _resolve_plan  # ruff:ignore[import-private-name]
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from contextlib import AbstractContextManager
+
+
+@pytest.fixture
+def cache_dir(tmp_path: Path) -> Iterator[Path]:
+    cache = tmp_path / "cache"
+    with mock.patch.object(encryption, "_CACHE_DIR", cache), mock.patch.dict(encryption._decrypted, clear=True):  # ruff:ignore[private-member-access]
+        yield cache
+
+
+@pytest.fixture
+def key() -> str:
+    return Fernet.generate_key().decode()
+
+
+def _encrypt(path: Path, key: str, content: str) -> Path:
+    path.write_bytes(Fernet(key.encode()).encrypt(content.encode()))
+    return path
+
+
+def test_encrypted_env_file(pytester: pytest.Pytester, key: str, cache_dir: Path) -> None:
+    _encrypt(pytester.path / ".env.enc", key, "SECRET=hunter2\nDSN=db://{SECRET}\n")
+    pytester.makefile(
+        ".toml", pytest='[pytest_env]\nenv_files = [".env.enc"]\nURL = {value = "x-{DSN}", transform = true}'
+    )
+    pytester.makepyfile(
+        dedent("""\
+            import os
+
+            def test_env():
+                assert os.environ["SECRET"] == "hunter2"
+                assert os.environ["URL"] == "x-db://{SECRET}"
+        """)
+    )
+
+    new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin", KEY_VAR: key}
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest()
+
+    result.assert_outcomes(passed=1)
+    assert not (pytester.path / ".env").exists()
+    assert len(list(cache_dir.iterdir())) == 1
+
+
+@pytest.mark.usefixtures("cache_dir")
+@pytest.mark.parametrize("from_file", [pytest.param(True, id="earlier file"), pytest.param(False, id="environment")])
+def test_encrypted_env_file_key_from_plan(tmp_path: Path, key: str, *, from_file: bool) -> None:
+    _encrypt(tmp_path / ".env.enc", key, "DECRYPTED=yes\n")
+    (tmp_path / "keys.env").write_text(f"{KEY_VAR}={key}\n" if from_file else "", encoding="utf-8")
+    config = StandaloneConfig(None, {"env_files": ["keys.env", ".env.enc"]}, argparse.Namespace(), tmp_path)
+
+    with mock.patch.dict(os.environ, {} if from_file else {KEY_VAR: key}, clear=True):
+        plan, _ = _resolve_plan(config, None, None)
+
+    assert plan.changes()["DECRYPTED"] == "yes"
+    assert plan.inputs.get(KEY_VAR) == (None if from_file else key)
+
+
+def test_decrypt_caches_plaintext_privately(tmp_path: Path, key: str, cache_dir: Path) -> None:
+    env_file = _encrypt(tmp_path / ".env.enc", key, "A=1\n")
+
+    assert decrypt_env_file(env_file, {KEY_VAR: key}) == "A=1\n"
+
+    (entry,) = cache_dir.iterdir()
+    assert stat.S_IMODE(cache_dir.stat().st_mode) == 0o700
+    assert stat.S_IMODE(entry.stat().st_mode) == 0o600
+    encryption._decrypted.clear()  # ruff:ignore[private-member-access]
+    with mock.patch.object(Fernet, "decrypt", side_effect=AssertionError) as decrypt:
+        assert decrypt_env_file(env_file, {KEY_VAR: key}) == "A=1\n"
+    decrypt.assert_not_called()
+
+    _encrypt(env_file, key, "A=2\n")
+    assert decrypt_env_file(env_file, {KEY_VAR: key}) == "A=2\n"
+    assert len(list(cache_dir.iterdir())) == 2
+    with mock.patch.object(encryption, "_private_cache_dir", side_effect=AssertionError):
+        assert decrypt_env_file(env_file, {KEY_VAR: key}) == "A=2\n"  # kept in memory
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_decrypt_with_key_file(tmp_path: Path, key: str) -> None:
+    env_file = _encrypt(tmp_path / ".env.enc", key, "A=1\n")
+    (key_file := tmp_path / "key").write_text(f"{key}\n", encoding="utf-8")
+
+    assert decrypt_env_file(env_file, {KEY_FILE_VAR: str(key_file)}) == "A=1\n"
+
+
+def test_decrypt_skips_shared_cache_dir(tmp_path: Path, key: str, cache_dir: Path) -> None:
+    cache_dir.mkdir(mode=0o755)
+    cache_dir.chmod(0o755)
+    env_file = _encrypt(tmp_path / ".env.enc", key, "A=1\n")
+
+    assert decrypt_env_file(env_file, {KEY_VAR: key}) == "A=1\n"
+    assert not list(cache_dir.iterdir())
+
+
+@pytest.mark.parametrize(
+    "failure",
+    [
+        pytest.param(mock.patch("os.getuid", return_value=os.getuid() + 1), id="owned by another user"),
+        pytest.param(mock.patch.object(Path, "mkdir", side_effect=PermissionError), id="mkdir fails"),
+        pytest.param(
+            mock.patch("tempfile.mkstemp", side_effect=OSError(errno.ENOSPC, "No space left")), id="disk full"
+        ),
+        pytest.param(mock.patch.object(Path, "replace", side_effect=OSError), id="write fails"),
+    ],
+)
+def test_decrypt_without_usable_cache(
+    tmp_path: Path, key: str, cache_dir: Path, failure: AbstractContextManager[object]
+) -> None:
+    env_file = _encrypt(tmp_path / ".env.enc", key, "A=1\n")
+
+    with failure:
+        assert decrypt_env_file(env_file, {KEY_VAR: key}) == "A=1\n"
+
+    assert not cache_dir.exists() or not list(cache_dir.iterdir())
+
+
+@pytest.mark.parametrize(
+    ("environ", "error", "match"),
+    [
+        pytest.param({}, LookupError, f"Set {KEY_VAR}", id="no key"),
+        pytest.param({KEY_VAR: Fernet.generate_key().decode()}, ValueError, "wrong key", id="wrong key"),
+    ],
+)
+@pytest.mark.usefixtures("cache_dir")
+def test_decrypt_fails(tmp_path: Path, key: str, environ: dict[str, str], error: type[Exception], match: str) -> None:
+    env_file = _encrypt(tmp_path / ".env.enc", key, "A=1\n")
+    with pytest.raises(error, match=match):
+        decrypt_env_file(env_file, environ)
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_decrypt_without_cryptography(tmp_path: Path, key: str) -> None:
+    env_file = _encrypt(tmp_path / ".env.enc", key, "A=1\n")
+    with mock.patch.dict(sys.modules, {"cryptography.fernet": None}), pytest.raises(ImportError, match="encrypted"):
+        decrypt_env_file(env_file, {KEY_VAR: key})
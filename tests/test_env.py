@@ -1,14 +1,26 @@
 from __future__ import annotations
 
+import argparse
+import bz2
+import gzip
+import lzma
 import os
 import re
+import sys
 from pathlib import Path
 from textwrap import dedent
+from typing import TYPE_CHECKING
 from unittest import mock
 
 import pytest
+from dotenv import dotenv_values
 
-from pytest_env.plugin import _load_toml_config  # ruff:ignore[import-private-name]
+from pytest_env import resolve
+from pytest_env.__main__ import StandaloneConfig
+from pytest_env.resolve import Entry, TomlConfig, _load_toml_config  # ruff:ignore[import-private-name]
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
 
 
 @pytest.mark.parametrize(
@@ -111,6 +123,18 @@ from pytest_env.plugin import _load_toml_config  # ruff:ignore[import-private-na
             {"MAGIC": "beta"},
             id="U flag then set - var is set",
         ),
+        pytest.param(
+            {},
+            "[pytest]\nenv = P:HOST=db\n P:PORT=5432\n URL=postgres://{HOST}:{PORT}",
+            {"URL": "postgres://db:5432", "HOST": None, "PORT": None},
+            id="P flag - private values expand but are not exported",
+        ),
+        pytest.param(
+            {},
+            "[pytest]\nenv = P:HOST=a\n HOST=b\n URL={HOST}",
+            {"HOST": "b", "URL": "b"},
+            id="P flag then set - later value expands",
+        ),
     ],
 )
 def test_env_via_pytest(
@@ -266,6 +290,15 @@ def test_env_via_pytest(
             None,
             id="pyproject toml unset non-existing",
         ),
+        pytest.param(
+            {"HOST": "outer"},
+            '[tool.pytest_env]\nHOST = {value = "db", private = true}\nURL = {value = "//{HOST}", transform = true}',
+            "",
+            "",
+            {"URL": "//db", "HOST": "outer"},
+            None,
+            id="pyproject toml private value shadows but is not exported",
+        ),
         pytest.param(
             {},
             '[tool.pytest_env]\nMAGIC = "parent"',
@@ -275,6 +308,15 @@ def test_env_via_pytest(
             "sub/pytest.toml",
             id="subdir pytest toml over parent pyproject toml",
         ),
+        pytest.param(
+            {},
+            '[tool.pytest_env]\nMAGIC = "parent"\nOTHER = "base"',
+            '[pytest_env]\nextends = "../pyproject.toml"\nMAGIC = "child"',
+            "",
+            {"MAGIC": "child", "OTHER": "base"},
+            "sub/pytest.toml",
+            id="subdir pytest toml extends parent pyproject toml",
+        ),
     ],
 )
 def test_env_via_toml(  # ruff:ignore[too-many-arguments, too-many-positional-arguments]
@@ -503,6 +545,103 @@ def test_env_via_env_file(  # ruff:ignore[too-many-arguments, too-many-positiona
     result.assert_outcomes(passed=1)
 
 
+@pytest.mark.parametrize(
+    ("compress", "file_name"),
+    [
+        pytest.param(gzip.compress, ".env.gz", id="gzip"),
+        pytest.param(bz2.compress, ".env.bz2", id="bzip2"),
+        pytest.param(lzma.compress, ".env.xz", id="xz"),
+        pytest.param(gzip.compress, ".env", id="detected by magic bytes"),
+    ],
+)
+def test_env_via_compressed_env_file(
+    pytester: pytest.Pytester, compress: Callable[[bytes], bytes], file_name: str
+) -> None:
+    (pytester.path / "test_compressed.py").symlink_to(Path(__file__).parent / "template.py")
+    (pytester.path / file_name).write_bytes(compress(b"MAGIC=alpha\nSORCERY=beta\n"))
+    (pytester.path / "pyproject.toml").write_text(f'[tool.pytest_env]\nenv_files = ["{file_name}"]', encoding="utf-8")
+
+    new_env = {
+        "_TEST_ENV": repr({"MAGIC": "alpha", "SORCERY": "beta"}),
+        "PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1",
+        "PYTEST_PLUGINS": "pytest_env.plugin",
+    }
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest()
+
+    result.assert_outcomes(passed=1)
+
+
+def test_env_file_expansion_matches_dotenv(tmp_path: Path) -> None:
+    env_file = tmp_path / ".env"
+    env_file.write_text("A=1\nB=${A}-${OUTER}-${MISSING:-fallback}\nC='${A}$'\nEMPTY\nD=${EMPTY}x\n", encoding="utf-8")
+
+    with mock.patch.dict(os.environ, {"OUTER": "o", "EMPTY": "env"}, clear=True):
+        values = resolve._read_env_file(env_file)  # ruff:ignore[private-member-access]
+        assert values == dotenv_values(env_file)
+
+    assert values == {"A": "1", "B": "1-o-fallback", "C": "1$", "EMPTY": None, "D": "x"}
+
+
+def test_env_files_expand_references_to_earlier_files(pytester: pytest.Pytester) -> None:
+    (pytester.path / "test_references.py").symlink_to(Path(__file__).parent / "template.py")
+    (pytester.path / "a.env").write_text("A=hello", encoding="utf-8")
+    (pytester.path / "b.env").write_text("B=${A}-world", encoding="utf-8")
+    (pytester.path / "c.env").write_text("C=${B}!", encoding="utf-8")
+    (pytester.path / "pyproject.toml").write_text(
+        '[tool.pytest_env]\nenv_files = ["a.env", "b.env"]\nenv_files_private = ["c.env"]\n'
+        'URL = {value = "{C}", transform = true}',
+        encoding="utf-8",
+    )
+
+    new_env = {
+        "_TEST_ENV": repr({"A": "hello", "B": "hello-world", "C": None, "URL": "hello-world!"}),
+        "PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1",
+        "PYTEST_PLUGINS": "pytest_env.plugin",
+    }
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest()
+
+    result.assert_outcomes(passed=1)
+
+
+def test_planned_environ_layers_changes_and_records_inputs() -> None:
+    with mock.patch.dict(os.environ, {"OUTER": "o", "GONE": "g"}, clear=True):
+        environ = resolve._PlannedEnviron({})  # ruff:ignore[private-member-access]
+        environ["NEW"] = "n"
+        del environ["GONE"]
+
+        with pytest.raises(KeyError):
+            environ["GONE"]
+        with pytest.raises(KeyError):
+            del environ["MISSING"]
+        assert dict(environ) == {"OUTER": "o", "NEW": "n"}
+        assert len(environ) == 2
+        assert os.environ == {"OUTER": "o", "GONE": "g"}
+
+    assert environ.inputs == {"GONE": "g", "MISSING": None, "OUTER": "o"}
+
+
+def test_env_files_private(pytester: pytest.Pytester) -> None:
+    (pytester.path / "test_private.py").symlink_to(Path(__file__).parent / "template.py")
+    (pytester.path / ".env.parts").write_text("HOST=db\nPORT=5432", encoding="utf-8")
+    (pytester.path / "pyproject.toml").write_text(
+        '[tool.pytest_env]\nenv_files_private = [".env.parts", "missing.env"]\n'
+        'URL = {value = "{HOST}:{PORT}", transform = true}',
+        encoding="utf-8",
+    )
+
+    new_env = {
+        "_TEST_ENV": repr({"URL": "db:5432", "HOST": None, "PORT": None}),
+        "PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1",
+        "PYTEST_PLUGINS": "pytest_env.plugin",
+    }
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest()
+
+    result.assert_outcomes(passed=1)
+
+
 @pytest.mark.parametrize(
     ("config_content", "config_file"),
     [
@@ -561,6 +700,116 @@ def test_env_files_from_toml_bad_toml(tmp_path: Path) -> None:
         _load_toml_config(toml_file)
 
 
+@pytest.mark.parametrize(
+    ("content", "fast_path"),
+    [
+        pytest.param(
+            '[project]\nname = "demo"\n[tool.pytest_env]\nMAGIC = "alpha"\n[tool.ruff]\nline-length = 120\n',
+            True,
+            id="section between other tables",
+        ),
+        pytest.param(
+            '[tool.pytest_env]\r\nMAGIC = "alpha"\r\n[tool.pytest_env.nested]\r\nvalue = "x"\r\n[tool.ruff]\r\n',
+            True,
+            id="sub-table with crlf line endings",
+        ),
+        pytest.param(
+            '[tool.pytest_env]\nMAGIC = "alpha"\n[tool.other]\ndescription = """\n[tool.fake]\n"""\n',
+            False,
+            id="multi-line string",
+        ),
+        pytest.param('[tool]\npytest_env.MAGIC = "alpha"\n', False, id="dotted key"),
+        pytest.param('[tool."pytest_env"]\nMAGIC = "alpha"\n', False, id="quoted table name"),
+        pytest.param('[tool.pytest_env]\nMAGIC = "alpha"\n[tool.pytest_env]\nOTHER = 1\n', None, id="duplicate table"),
+    ],
+)
+def test_load_toml_config_section_only(tmp_path: Path, content: str, fast_path: bool | None) -> None:
+    toml_file = tmp_path / "pyproject.toml"
+    toml_file.write_text(content, encoding="utf-8", newline="")
+    with mock.patch.object(resolve.tomllib, "loads", wraps=resolve.tomllib.loads) as loads:
+        if fast_path is None:
+            with pytest.raises(Exception, match="Cannot declare"):
+                _load_toml_config(toml_file)
+            return
+        config = _load_toml_config(toml_file)
+
+    assert config.entries[0] == Entry("MAGIC", "alpha", transform=False, skip_if_set=False)
+    assert any(call.args == (content,) for call in loads.call_args_list) is not fast_path
+
+
+def test_ini_entries_are_compact(tmp_path: Path) -> None:
+    lines = ["NAME=plain", "d:r:u:p: NAME = flagged", "X:NAME={NAME}"]
+    early_config = StandaloneConfig(tmp_path / "tox.ini", {"env": lines}, argparse.Namespace())
+
+    plain, flagged, unknown = resolve._load_values(early_config)  # ruff:ignore[private-member-access]
+
+    assert plain == Entry("NAME", "plain", transform=True, skip_if_set=False)
+    assert flagged == Entry("NAME", "flagged", transform=False, skip_if_set=True, unset=True, private=True)
+    assert unknown == Entry("NAME", "{NAME}", transform=True, skip_if_set=False)
+    assert plain.key is flagged.key is sys.intern("NAME")
+    assert not hasattr(flagged, "__dict__")
+    assert flagged.with_value("other") == Entry(
+        "NAME", "other", transform=False, skip_if_set=True, unset=True, private=True
+    )
+    assert (
+        repr(plain) == "Entry(key='NAME', value='plain', transform=True, skip_if_set=False, unset=False, private=False)"
+    )
+
+
+def test_load_toml_config_without_section_skips_parse(tmp_path: Path) -> None:
+    toml_file = tmp_path / "pyproject.toml"
+    toml_file.write_text('[project]\nname = "demo"\n[tool.ruff]\nline-length = 120\n', encoding="utf-8")
+    with mock.patch.object(resolve.tomllib, "loads") as loads:
+        assert _load_toml_config(toml_file) == TomlConfig()
+    loads.assert_not_called()
+
+
+def test_load_toml_config_extends(tmp_path: Path) -> None:
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.pytest_env]\nenv_files = [".env.base"]\nenv_files_skip_if_set = true\nFIRST = "1"\nSECOND = "2"',
+        encoding="utf-8",
+    )
+    (package := tmp_path / "package").mkdir()
+    (package / "pyproject.toml").write_text(
+        '[tool.pytest_env]\nextends = "../pyproject.toml"\nenv_files = [".env"]\nSECOND = "override"\nTHIRD = "3"',
+        encoding="utf-8",
+    )
+
+    config = _load_toml_config(package / "pyproject.toml")
+
+    assert config.env_files == [str(tmp_path.resolve() / ".env.base"), ".env"]
+    assert config.env_files_skip_if_set is True
+    assert [(entry.key, entry.value) for entry in config.entries] == [
+        ("FIRST", "1"),
+        ("SECOND", "override"),
+        ("THIRD", "3"),
+    ]
+
+
+def test_load_toml_config_memoized_until_a_layer_changes(tmp_path: Path) -> None:
+    (base := tmp_path / "base.toml").write_text('[pytest_env]\nMAGIC = "alpha"', encoding="utf-8")
+    (child := tmp_path / "pytest.toml").write_text('[pytest_env]\nextends = "base.toml"', encoding="utf-8")
+    with mock.patch.object(resolve, "_parse_toml_file", wraps=resolve._parse_toml_file) as parse:  # ruff:ignore[private-member-access]
+        assert _load_toml_config(child) is _load_toml_config(child)
+        assert parse.call_count == 2
+
+        base.write_text('[pytest_env]\nMAGIC = "beta!"', encoding="utf-8")
+        assert _load_toml_config(child).entries[0].value == "beta!"
+
+
+@pytest.mark.parametrize(
+    ("extends", "error", "match"),
+    [
+        pytest.param("pytest.toml", ValueError, "Circular extends", id="cycle"),
+        pytest.param("missing.toml", FileNotFoundError, "Extended configuration not found: missing.toml", id="missing"),
+    ],
+)
+def test_load_toml_config_extends_invalid(tmp_path: Path, extends: str, error: type[Exception], match: str) -> None:
+    (toml_file := tmp_path / "pytest.toml").write_text(f'[pytest_env]\nextends = "{extends}"', encoding="utf-8")
+    with pytest.raises(error, match=match):
+        _load_toml_config(toml_file)
+
+
 @pytest.mark.parametrize("toml_name", ["pytest.toml", ".pytest.toml", "pyproject.toml"])
 def test_env_via_pyproject_toml_bad(pytester: pytest.Pytester, toml_name: str) -> None:
     toml_file = pytester.path / toml_name
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from pytest_env import resolve
+from pytest_env.resolve import _read_env_dir  # ruff:ignore[import-private-name]
+
+
+@pytest.fixture
+def plugin_env() -> dict[str, str]:
+    return {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+
+
+@pytest.fixture
+def secrets(tmp_path: Path) -> Path:
+    (secrets := tmp_path / "secrets").mkdir()
+    (secrets / "DB_PASSWORD").write_text("s3cret\n", encoding="utf-8")
+    (secrets / "API_TOKEN").write_text("line one\nline two\r\n", encoding="utf-8")
+    (secrets / ".hidden").write_text("nope", encoding="utf-8")
+    (secrets / "nested").mkdir()
+    (secrets / "keystore.p12").write_bytes(b"\x30\x82\xff\xfe binary")
+    return secrets
+
+
+@pytest.mark.parametrize("parallel_reads", [64, 0], ids=["sequential", "parallel"])
+def test_read_env_dir(secrets: Path, parallel_reads: int) -> None:
+    with mock.patch.object(resolve, "_ENV_DIR_PARALLEL_READS", parallel_reads):
+        assert _read_env_dir(secrets) == {"API_TOKEN": "line one\nline two", "DB_PASSWORD": "s3cret"}
+
+
+@pytest.mark.parametrize(
+    ("config", "env", "expected_env"),
+    [
+        pytest.param(
+            '[pytest_env]\nenv_files = [".env"]\nenv_dirs = ["secrets"]',
+            {},
+            {"DB_PASSWORD": "s3cret", "DB_USER": "app", "nested": None},
+            id="toml dirs override env files",
+        ),
+        pytest.param(
+            '[pytest_env]\nenv_dirs = ["secrets"]\nenv_files_skip_if_set = true',
+            {"DB_PASSWORD": "outer"},
+            {"DB_PASSWORD": "outer", "API_TOKEN": "line one\nline two"},
+            id="toml skip if set",
+        ),
+        pytest.param(
+            '[pytest_env]\nenv_dirs = ["secrets"]\nDB_PASSWORD = "inline"',
+            {},
+            {"DB_PASSWORD": "inline"},
+            id="inline entries win",
+        ),
+    ],
+)
+def test_env_dirs(  # ruff:ignore[too-many-arguments, too-many-positional-arguments]
+    pytester: pytest.Pytester,
+    secrets: Path,
+    plugin_env: dict[str, str],
+    config: str,
+    env: dict[str, str],
+    expected_env: dict[str, str | None],
+) -> None:
+    secrets.rename(pytester.path / "secrets")
+    (pytester.path / ".env").write_text("DB_PASSWORD=from-file\nDB_USER=app", encoding="utf-8")
+    (pytester.path / "pytest.toml").write_text(config, encoding="utf-8")
+    (pytester.path / "test_it.py").symlink_to(Path(__file__).parent / "template.py")
+
+    with mock.patch.dict(os.environ, {**plugin_env, **env, "_TEST_ENV": repr(expected_env)}, clear=True):
+        result = pytester.runpytest()
+
+    result.assert_outcomes(passed=1)
+
+
+def test_envdir_cli(pytester: pytest.Pytester, secrets: Path, plugin_env: dict[str, str]) -> None:
+    (pytester.path / "pytest.ini").write_text("[pytest]\nenv_dirs = missing", encoding="utf-8")
+    (pytester.path / "test_it.py").symlink_to(Path(__file__).parent / "template.py")
+
+    with mock.patch.dict(os.environ, {**plugin_env, "_TEST_ENV": repr({"DB_PASSWORD": "s3cret"})}, clear=True):
+        result = pytester.runpytest("--envdir", str(secrets))
+
+    result.assert_outcomes(passed=1)
+
+
+def test_envdir_cli_missing(pytester: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    pytester.makepyfile(test_it="def test_it() -> None:\n    pass")
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = pytester.runpytest("--envdir", "missing")
+
+    assert result.ret != 0
+    assert any("Environment directory not found: missing" in line for line in result.errlines)
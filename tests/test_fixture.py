@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import os
+from textwrap import dedent
+from unittest import mock
+
+import pytest
+
+from pytest_env.plugin import Entry, EnvPatcher
+
+
+def test_env_patcher_undo_restores_in_one_pass() -> None:
+    with mock.patch.dict(os.environ, {"KEEP": "old", "GONE": "here"}, clear=True):
+        patcher = EnvPatcher()
+        patcher.update({"KEEP": "new", "ADDED": "1"}, EXTRA="2")
+        patcher.update(KEEP="newer")
+        patcher.unset("GONE", "MISSING")
+        assert dict(os.environ) == {"KEEP": "newer", "ADDED": "1", "EXTRA": "2"}
+
+        patcher.undo()
+
+        assert dict(os.environ) == {"KEEP": "old", "GONE": "here"}
+
+
+@pytest.mark.parametrize(
+    ("entries", "expected"),
+    [
+        pytest.param([Entry("MAGIC", "beta", transform=False, skip_if_set=False)], "beta", id="set"),
+        pytest.param([Entry("MAGIC", "beta", transform=False, skip_if_set=True)], "alpha", id="skip if set"),
+        pytest.param([Entry("MAGIC", "{MAGIC}_b", transform=True, skip_if_set=False)], "alpha_b", id="transform"),
+        pytest.param([Entry("MAGIC", "{MAGIC}_b", transform=False, skip_if_set=False)], "{MAGIC}_b", id="raw"),
+        pytest.param([Entry("MAGIC", "", transform=False, skip_if_set=False, unset=True)], None, id="unset"),
+        pytest.param(
+            [
+                Entry("PART", "{MAGIC}_b", transform=True, skip_if_set=False, private=True),
+                Entry("MAGIC", "{PART}_c", transform=True, skip_if_set=False),
+            ],
+            "alpha_b_c",
+            id="private",
+        ),
+        pytest.param(
+            [
+                Entry("MAGIC", "private", transform=False, skip_if_set=False, private=True),
+                Entry("MAGIC", "beta", transform=False, skip_if_set=False),
+                Entry("MAGIC", "{MAGIC}_c", transform=True, skip_if_set=False),
+            ],
+            "beta_c",
+            id="private then set",
+        ),
+    ],
+)
+def test_env_patcher_apply_entries(entries: list[Entry], expected: str | None) -> None:
+    with mock.patch.dict(os.environ, {"MAGIC": "alpha"}, clear=True):
+        patcher = EnvPatcher()
+        patcher.apply_entries(entries)
+        assert os.environ.get("MAGIC") == expected
+        assert "PART" not in os.environ
+
+        patcher.undo()
+
+        assert os.environ["MAGIC"] == "alpha"
+
+
+def test_env_fixtures_restore_per_scope(pytester: pytest.Pytester) -> None:
+    pytester.makepyfile(
+        test_a=dedent("""\
+            import os
+
+            def test_set(env, module_env, session_env):
+                session_env.update(SESSION="1")
+                module_env.update(MODULE="1")
+                env.update(FUNCTION="1")
+
+            def test_module_scope_kept():
+                assert os.environ["SESSION"] == "1"
+                assert os.environ["MODULE"] == "1"
+                assert "FUNCTION" not in os.environ
+        """),
+        test_b=dedent("""\
+            import os
+
+            def test_other_module():
+                assert os.environ["SESSION"] == "1"
+                assert "MODULE" not in os.environ
+        """),
+    )
+
+    new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest()
+        assert "SESSION" not in os.environ
+
+    result.assert_outcomes(passed=3)
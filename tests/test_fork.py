@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
+from unittest import mock
+
+import pytest
+
+from pytest_env import plugin
+from pytest_env.plugin import last_snapshot
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from contextlib import AbstractContextManager
+
+
+@pytest.fixture
+def project(pytester: pytest.Pytester) -> Iterator[pytest.Pytester]:
+    (pytester.path / "test_it.py").symlink_to(Path(__file__).parent / "template.py")
+    (pytester.path / "pyproject.toml").write_text('[tool.pytest_env]\nMAGIC = "alpha"', encoding="utf-8")
+    new_env = {
+        "_TEST_ENV": repr({"MAGIC": "alpha"}),
+        "PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1",
+        "PYTEST_PLUGINS": "pytest_env.plugin",
+    }
+    with mock.patch.dict(os.environ, new_env, clear=True), mock.patch.dict(plugin._snapshots, clear=True):  # ruff:ignore[private-member-access]
+        yield pytester
+
+
+def _as_forked_child() -> AbstractContextManager[mock.MagicMock]:
+    return mock.patch("os.getpid", return_value=os.getpid() + 1)
+
+
+def test_snapshot_of_resolved_plan(project: pytest.Pytester) -> None:
+    (project.path / "pyproject.toml").write_text(
+        '[tool.pytest_env]\nMAGIC = "alpha"\nGONE = { unset = true }', encoding="utf-8"
+    )
+    project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+
+    snapshot = last_snapshot()
+    assert snapshot is not None
+    assert snapshot.changes == {"MAGIC": "alpha", "GONE": None}
+    assert str(project.path / "pyproject.toml") in snapshot.sources
+    assert not snapshot.changed()
+    assert snapshot.reapply() == {}
+    del os.environ["MAGIC"]
+    os.environ["GONE"] = "back"
+    assert snapshot.reapply() == {"MAGIC": "alpha", "GONE": None}
+    assert os.environ["MAGIC"] == "alpha"
+    assert "GONE" not in os.environ
+
+
+def test_forked_child_reapplies_snapshot(project: pytest.Pytester) -> None:
+    project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+    del os.environ["MAGIC"]
+
+    with _as_forked_child(), mock.patch.object(plugin, "_resolve_plan", side_effect=AssertionError("resolved again")):
+        result = project.runpytest("--pytest-env-fork-snapshot", "--pytest-env-verbose")
+
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(["*SET*MAGIC=alpha*(from*pyproject.toml*"])
+
+
+def test_forked_child_resolves_when_sources_change(project: pytest.Pytester) -> None:
+    project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+    (project.path / "pyproject.toml").write_text('[tool.pytest_env]\nMAGIC = "beta"', encoding="utf-8")
+    os.environ["_TEST_ENV"] = repr({"MAGIC": "beta"})
+
+    with _as_forked_child():
+        project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+
+
+def test_forked_child_resolves_when_missing_file_created(project: pytest.Pytester) -> None:
+    (project.path / "pyproject.toml").write_text(
+        '[tool.pytest_env]\nenv_files = [".env"]\nMAGIC = "alpha"', encoding="utf-8"
+    )
+    project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+    snapshot = last_snapshot()
+    assert snapshot is not None
+    assert snapshot.sources[str(project.path / ".env")] is None
+    (project.path / ".env").write_text("OTHER=1\n", encoding="utf-8")
+    os.environ["_TEST_ENV"] = repr({"MAGIC": "alpha", "OTHER": "1"})
+
+    with _as_forked_child():
+        project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+
+
+def test_forked_child_resolves_when_inputs_change(project: pytest.Pytester) -> None:
+    (project.path / "pyproject.toml").write_text(
+        '[tool.pytest_env]\nMAGIC = { value = "{OUTER}", transform = true }', encoding="utf-8"
+    )
+    os.environ.update(OUTER="alpha", _TEST_ENV=repr({"MAGIC": "alpha"}))
+    project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+    os.environ.update(OUTER="beta", _TEST_ENV=repr({"MAGIC": "beta"}))
+
+    with _as_forked_child(), mock.patch.object(plugin, "_resolve_plan", wraps=plugin._resolve_plan) as resolve_plan:  # ruff:ignore[private-member-access]
+        project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+
+    resolve_plan.assert_called_once()
+
+
+def test_forked_child_resolves_when_env_dir_file_edited(project: pytest.Pytester) -> None:
+    (secrets := project.path / "secrets").mkdir()
+    (token := secrets / "TOKEN").write_text("old", encoding="utf-8")
+    (project.path / "pyproject.toml").write_text('[tool.pytest_env]\nenv_dirs = ["secrets"]', encoding="utf-8")
+    os.environ["_TEST_ENV"] = repr({"TOKEN": "old"})
+    project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+    directory = secrets.stat()
+    token.write_text("new", encoding="utf-8")  # rotated in place, same size and directory listing
+    os.utime(token, ns=(token.stat().st_atime_ns, token.stat().st_mtime_ns + 1_000_000_000))
+    os.utime(secrets, ns=(directory.st_atime_ns, directory.st_mtime_ns))
+    os.environ["_TEST_ENV"] = repr({"TOKEN": "new"})
+
+    with _as_forked_child():
+        project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+
+
+def test_only_latest_snapshot_kept(project: pytest.Pytester) -> None:
+    (project.path / "extra.env").write_text("MAGIC=alpha\n", encoding="utf-8")
+    project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+    project.runpytest("--pytest-env-fork-snapshot", "--envfile", "+extra.env").assert_outcomes(passed=1)
+
+    assert len(plugin._snapshots) == 1  # ruff:ignore[private-member-access]
+    snapshot = last_snapshot()
+    assert snapshot is not None
+    assert str(project.path / "extra.env") in snapshot.sources
+
+
+def test_snapshot_needs_option(project: pytest.Pytester) -> None:
+    project.runpytest().assert_outcomes(passed=1)
+
+    assert last_snapshot() is None
+
+    with _as_forked_child(), mock.patch.object(plugin, "_forked_snapshot", side_effect=AssertionError("reused")):
+        project.runpytest().assert_outcomes(passed=1)
+
+
+def test_same_process_resolves_again(project: pytest.Pytester) -> None:
+    project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+
+    with mock.patch.object(plugin, "_resolve_plan", wraps=plugin._resolve_plan) as resolve_plan:  # ruff:ignore[private-member-access]
+        project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+
+    resolve_plan.assert_called_once()
+
+
+def test_generated_plan_not_snapshotted(project: pytest.Pytester) -> None:
+    (project.path / "pyproject.toml").write_text('[tool.pytest_env]\nRUN_ID = { generate = "uuid" }', encoding="utf-8")
+    os.environ["_TEST_ENV"] = repr({})
+
+    project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+
+    assert last_snapshot() is None
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs os.fork")
+def test_real_fork_skips_resolution(project: pytest.Pytester) -> None:
+    project.runpytest("--pytest-env-fork-snapshot").assert_outcomes(passed=1)
+
+    if (pid := os.fork()) == 0:  # pragma: no cover # the child exits without writing coverage data
+        code = 1
+        try:
+            with mock.patch.object(plugin, "_resolve_plan", side_effect=AssertionError("resolved again")):
+                code = project.runpytest("--pytest-env-fork-snapshot", "-p", "no:cacheprovider").ret
+        finally:
+            os._exit(code)
+    assert os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]) == 0
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import os
+import stat
+import subprocess  # ruff:ignore[suspicious-subprocess-import]
+import sys
+from pathlib import Path
+from textwrap import dedent
+from typing import TYPE_CHECKING
+from unittest import mock
+
+import pytest
+
+from pytest_env import resolve
+from pytest_env.resolve import _allocation_stale, _free_port, _generate  # ruff:ignore[import-private-name]
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from contextlib import AbstractContextManager
+
+
+@pytest.fixture
+def allocations(tmp_path: Path) -> Iterator[Path]:
+    with mock.patch.object(resolve, "_PORT_ALLOCATIONS", tmp_path / "ports"):
+        yield tmp_path / "ports"
+
+
+def test_free_port_reserves_an_allocation_file(allocations: Path) -> None:
+    ports = {_free_port("PORT") for _ in range(5)}
+
+    assert len(ports) == 5
+    assert {path.name for path in allocations.iterdir()} == ports
+    assert stat.S_IMODE(allocations.stat().st_mode) == 0o700
+    assert {path.read_text(encoding="utf-8") for path in allocations.iterdir()} == {str(os.getpid())}
+
+
+def test_free_port_gives_up(allocations: Path) -> None:
+    with mock.patch.object(resolve, "_PORT_ATTEMPTS", 0), pytest.raises(RuntimeError, match="free port for PORT"):
+        _free_port("PORT")
+    assert allocations.is_dir()
+
+
+def test_free_port_skips_ports_reserved_by_running_processes(allocations: Path) -> None:
+    allocations.mkdir()
+    (allocations / "1").write_text(str(os.getpid()), encoding="utf-8")
+    with mock.patch("socket.socket.getsockname", side_effect=[("127.0.0.1", 1), ("127.0.0.1", 2)]):
+        assert _free_port("PORT") == "2"
+
+
+@pytest.mark.parametrize(
+    "failure",
+    [
+        pytest.param(mock.patch("os.getuid", return_value=os.getuid() + 1), id="owned by another user"),
+        pytest.param(mock.patch.object(Path, "mkdir", side_effect=PermissionError), id="mkdir fails"),
+    ],
+)
+def test_free_port_without_usable_allocations(allocations: Path, failure: AbstractContextManager[object]) -> None:
+    allocations.mkdir()
+    with failure:
+        port = _free_port("PORT")
+
+    assert port.isdigit()
+    assert not list(allocations.iterdir())
+
+
+def test_free_port_allocations_not_a_directory(allocations: Path) -> None:
+    allocations.write_text("", encoding="utf-8")
+
+    assert _free_port("PORT").isdigit()
+
+
+@pytest.mark.skipif(os.name != "posix", reason="liveness is only probed on POSIX")
+def test_free_port_reclaims_allocations_of_finished_processes(allocations: Path) -> None:
+    finished = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, check=True)
+    allocations.mkdir()
+    (allocations / "1").write_bytes(finished.stdout.strip())
+    with mock.patch("socket.socket.getsockname", return_value=("127.0.0.1", 1)):
+        assert _free_port("PORT") == "1"
+    assert (allocations / "1").read_text(encoding="utf-8") == str(os.getpid())
+
+
+@pytest.mark.skipif(os.name != "posix", reason="liveness is only probed on POSIX")
+def test_allocation_stale(tmp_path: Path) -> None:
+    finished = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, check=True)
+    (dead := tmp_path / "dead").write_bytes(finished.stdout.strip())
+    (alive := tmp_path / "alive").write_text(str(os.getpid()), encoding="utf-8")
+    (garbage := tmp_path / "garbage").write_text("", encoding="utf-8")
+
+    assert _allocation_stale(dead) is True
+    assert _allocation_stale(alive) is False
+    with mock.patch("os.kill", side_effect=PermissionError):
+        assert _allocation_stale(alive) is False  # alive, even when probing it is not permitted
+    assert _allocation_stale(garbage) is False
+    assert _allocation_stale(tmp_path / "missing") is False
+
+
+def test_generate_once_per_process() -> None:
+    assert _generate("ONCE", "uuid") == _generate("ONCE", "uuid")
+    with pytest.raises(ValueError, match="Unknown generator 'nope' for BAD, expected one of: free_port, tmpdir, uuid"):
+        _generate("BAD", "nope")
+
+
+def test_generated_entries(pytester: pytest.Pytester) -> None:
+    pytester.makefile(
+        ".toml",
+        pytest=dedent("""\
+            [pytest_env]
+            PORT = { generate = "free_port" }
+            WORK_DIR = { generate = "tmpdir" }
+            RUN_ID = { generate = "uuid", private = true }
+            URL = { value = "http://localhost:{PORT}/{RUN_ID}", transform = true }
+        """),
+    )
+    pytester.makepyfile(
+        test_it=dedent("""\
+            import os
+            import uuid
+
+            def test_it():
+                assert os.environ["PORT"].isdigit()
+                assert os.path.isdir(os.environ["WORK_DIR"])
+                assert "RUN_ID" not in os.environ
+                prefix, run_id = os.environ["URL"].rsplit("/", 1)
+                assert prefix == f"http://localhost:{os.environ['PORT']}"
+                uuid.UUID(run_id)
+                assert "PYTEST_ENV_HANDOFF" not in os.environ
+        """)
+    )
+
+    new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest("--pytest-env-handoff")
+
+    result.assert_outcomes(passed=1)
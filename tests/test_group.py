@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import os
+import re
+from textwrap import dedent
+from unittest import mock
+
+import pytest
+
+_TESTS = dedent("""\
+    import os
+
+    import pytest
+
+    pytestmark = pytest.mark.pytest_env(MODULE="module", MAGIC="module")
+
+    @pytest.mark.pytest_env(MAGIC="a")
+    def test_a1():
+        assert os.environ["MAGIC"] == "a"
+        assert os.environ["MODULE"] == "module"
+
+    @pytest.mark.pytest_env(MAGIC="b", NUMBER=1)
+    def test_b1():
+        assert os.environ["MAGIC"] == "b"
+        assert os.environ["NUMBER"] == "1"
+
+    @pytest.mark.pytest_env(MAGIC="a")
+    def test_a2():
+        assert os.environ["MAGIC"] == "a"
+        assert "NUMBER" not in os.environ
+
+    def test_module():
+        assert os.environ["MAGIC"] == "module"
+
+    @pytest.mark.pytest_env(MAGIC="b", NUMBER=1)
+    def test_b2():
+        assert os.environ["MAGIC"] == "b"
+""")
+
+
+@pytest.fixture
+def plugin_env() -> dict[str, str]:
+    return {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+
+
+def test_env_marker_overlays_session_environment(pytester: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    pytester.makepyfile(test_it=_TESTS)
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = pytester.runpytest("-v")
+        assert "MAGIC" not in os.environ
+
+    result.assert_outcomes(passed=5)
+    result.stdout.fnmatch_lines(["*test_a1*", "*test_b1*", "*test_a2*", "*test_module*", "*test_b2*"])
+
+
+def test_group_runs_same_overlay_together(pytester: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    pytester.makepyfile(test_it=_TESTS)
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = pytester.runpytest("-v", "--pytest-env-group")
+
+    result.assert_outcomes(passed=5)
+    result.stdout.fnmatch_lines(["*test_a1*", "*test_a2*", "*test_b1*", "*test_b2*", "*test_module*"])
+
+
+def test_group_stays_within_modules(pytester: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    pytester.makepyfile(test_one=_TESTS, test_two=_TESTS)
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = pytester.runpytest("-v", "--pytest-env-group")
+
+    result.assert_outcomes(passed=10)
+    result.stdout.fnmatch_lines([
+        f"*{module}::{name} *"
+        for module in ("test_one.py", "test_two.py")
+        for name in ("test_a1", "test_a2", "test_b1", "test_b2", "test_module")
+    ])
+
+
+def test_group_marks_xdist_groups_for_loadgroup(pytester: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    pytester.makepyfile(test_it=_TESTS)
+    pytester.makeconftest("def pytest_addoption(parser):\n    parser.addoption('--dist')\n")
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        items, _ = pytester.inline_genitems("--pytest-env-group", "--dist", "loadgroup")
+
+    groups = {item.name: mark.kwargs["name"] for item in items if (mark := item.get_closest_marker("xdist_group"))}
+    assert len(groups) == len(items)
+    assert groups["test_a1"] == groups["test_a2"] != groups["test_b1"] == groups["test_b2"] != groups["test_module"]
+    assert all(group.startswith("pytest-env-") for group in groups.values())
+
+
+def test_group_leaves_tests_without_overlay_ungrouped(pytester: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    pytester.makepyfile(test_it="def test_plain():\n    pass\n")
+    pytester.makeconftest("def pytest_addoption(parser):\n    parser.addoption('--dist')\n")
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        items, _ = pytester.inline_genitems("--pytest-env-group", "--dist", "loadgroup")
+
+    assert [item.get_closest_marker("xdist_group") for item in items] == [None]
+
+
+def test_group_keeps_overlay_on_one_xdist_worker(pytester: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    pytester.makepyfile(test_it=_TESTS)
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = pytester.runpytest_subprocess(
+            "-p", "xdist", "-n", "2", "--dist", "loadgroup", "--pytest-env-group", "-v"
+        )
+
+    result.assert_outcomes(passed=5)
+    workers = {
+        name: worker for worker, name in re.findall(r"\[(gw\d+)\].*PASSED test_it\.py::(\w+)@", result.stdout.str())
+    }
+    assert workers.keys() == {"test_a1", "test_a2", "test_b1", "test_b2", "test_module"}
+    assert workers["test_a1"] == workers["test_a2"]
+    assert workers["test_b1"] == workers["test_b2"]
+
+
+def test_group_balances_tests_without_overlay(pytester: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    plain = "".join(f"def test_{index}():\n    pass\n\n" for index in range(5))
+    pytester.makepyfile(**{f"test_{module}": plain for module in "abcd"})
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = pytester.runpytest_subprocess(
+            "-p", "xdist", "-n", "2", "--dist", "loadgroup", "--pytest-env-group", "-v"
+        )
+
+    result.assert_outcomes(passed=20)
+    assert "@pytest-env-" not in result.stdout.str()
+    assert len(set(re.findall(r"\[(gw\d+)\].*PASSED", result.stdout.str()))) > 1
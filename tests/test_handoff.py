@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import stat
+import sys
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from pytest_env import plugin
+
+
+@pytest.fixture
+def project(pytester: pytest.Pytester) -> pytest.Pytester:
+    (pytester.path / "test_it.py").symlink_to(Path(__file__).parent / "template.py")
+    (pytester.path / "pyproject.toml").write_text(
+        '[tool.pytest_env]\nMAGIC = "alpha"\nenv_nested_configs = true', encoding="utf-8"
+    )
+    return pytester
+
+
+def _session_env(expected: dict[str, str | None]) -> dict[str, str]:
+    return {"_TEST_ENV": repr(expected), "PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+
+
+def test_handoff_reused_by_nested_session(project: pytest.Pytester) -> None:
+    with mock.patch.dict(os.environ, _session_env({"MAGIC": "alpha"}), clear=True):
+        project.runpytest("--pytest-env-handoff").assert_outcomes(passed=1)
+        assert "PYTEST_ENV_HANDOFF" in os.environ
+        del os.environ["MAGIC"]
+
+        with mock.patch("pytest_env.plugin._resolve_plan", side_effect=AssertionError("resolved again")):
+            result = project.runpytest("--pytest-env-verbose")
+
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(["*SET*MAGIC=alpha*(from*pyproject.toml*"])
+
+
+def test_handoff_ignored_when_sources_change(project: pytest.Pytester) -> None:
+    with mock.patch.dict(os.environ, _session_env({"MAGIC": "alpha"}), clear=True):
+        project.runpytest("--pytest-env-handoff").assert_outcomes(passed=1)
+        (project.path / "pyproject.toml").write_text('[tool.pytest_env]\nMAGIC = "beta"', encoding="utf-8")
+        os.environ["_TEST_ENV"] = repr({"MAGIC": "beta"})
+
+        result = project.runpytest()
+
+    result.assert_outcomes(passed=1)
+
+
+@pytest.mark.parametrize(
+    ("preset", "resolved_again"),
+    [
+        pytest.param("alpha", False, id="planned value"),
+        pytest.param("preset", True, id="changed value"),
+    ],
+)
+def test_handoff_checks_variables_read_by_resolution(
+    project: pytest.Pytester, preset: str, *, resolved_again: bool
+) -> None:
+    (project.path / "pyproject.toml").write_text(
+        '[tool.pytest_env]\nMAGIC = {value = "alpha", skip_if_set = true}', encoding="utf-8"
+    )
+    with mock.patch.dict(os.environ, _session_env({"MAGIC": "alpha"}), clear=True):
+        project.runpytest("--pytest-env-handoff").assert_outcomes(passed=1)
+        os.environ.update({"MAGIC": preset, "_TEST_ENV": repr({"MAGIC": preset})})
+
+        with mock.patch("pytest_env.plugin._resolve_plan", wraps=plugin._resolve_plan) as resolve_plan:  # ruff:ignore[private-member-access]
+            project.runpytest().assert_outcomes(passed=1)
+
+    assert resolve_plan.called is resolved_again
+
+
+def test_handoff_leaves_out_private_values(project: pytest.Pytester) -> None:
+    (project.path / "pyproject.toml").write_text(
+        '[tool.pytest_env]\nMAGIC = "alpha"\nTOKEN = { value = "s3cret", private = true }', encoding="utf-8"
+    )
+    with mock.patch.dict(os.environ, _session_env({"MAGIC": "alpha", "TOKEN": None}), clear=True):
+        project.runpytest("--pytest-env-handoff").assert_outcomes(passed=1)
+        handoff = Path(os.environ["PYTEST_ENV_HANDOFF"].partition(":")[2])
+        assert "s3cret" not in handoff.read_text(encoding="utf-8")
+
+        with mock.patch("pytest_env.plugin._resolve_plan", side_effect=AssertionError("resolved again")):
+            project.runpytest().assert_outcomes(passed=1)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="POSIX file permissions")
+def test_handoff_exports_reference_to_private_file(project: pytest.Pytester) -> None:
+    with mock.patch.dict(os.environ, _session_env({"MAGIC": "alpha"}), clear=True):
+        project.runpytest("--pytest-env-handoff").assert_outcomes(passed=1)
+        digest, _, path = os.environ["PYTEST_ENV_HANDOFF"].partition(":")
+
+    handoff = Path(path)
+    assert stat.S_IMODE(handoff.stat().st_mode) == 0o600
+    assert hashlib.sha256(handoff.read_bytes()).hexdigest() == digest
+    plugin._remove_handoff(handoff, os.getpid() + 1)  # ruff:ignore[private-member-access]
+    assert handoff.exists()
+    plugin._remove_handoff(handoff, os.getpid())  # ruff:ignore[private-member-access]
+    assert not handoff.exists()
+
+
+@pytest.mark.parametrize(
+    ("payload", "digest"),
+    [
+        pytest.param(None, "", id="missing file"),
+        pytest.param('{"fingerprint": "other"}', None, id="other configuration"),
+        pytest.param('{"fingerprint": "other"}', "0" * 64, id="digest mismatch"),
+    ],
+)
+def test_handoff_ignored_when_not_matching(project: pytest.Pytester, payload: str | None, digest: str | None) -> None:
+    handoff = project.path / "handoff.json"
+    if payload is not None:
+        handoff.write_text(payload, encoding="utf-8")
+    digest = hashlib.sha256(handoff.read_bytes()).hexdigest() if digest is None else digest
+    new_env = {**_session_env({"MAGIC": "alpha"}), "PYTEST_ENV_HANDOFF": f"{digest}:{handoff}"}
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = project.runpytest()
+
+    result.assert_outcomes(passed=1)
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import os
+from textwrap import dedent
+from typing import TYPE_CHECKING
+from unittest import mock
+
+if TYPE_CHECKING:
+    import pytest
+
+
+def test_plugins_contribute_entries_and_transform_the_plan(pytester: pytest.Pytester) -> None:
+    pytester.makepyfile(
+        env_source=dedent("""\
+            from pytest_env.plugin import Action, Entry
+
+            def pytest_env_collect_sources(config):
+                return [Entry("URL", "http://{HOST}", transform=True, skip_if_set=False)]
+
+            def pytest_env_resolve(config, plan):
+                plan.actions.append(Action("SET", "EXTRA", "1", "env_source"))
+        """),
+        test_it=dedent("""\
+            import os
+
+            def test_it():
+                assert os.environ["URL"] == "http://configured"
+                assert os.environ["EXTRA"] == "1"
+        """),
+    )
+    pytester.makefile(".toml", pytest='[pytest_env]\nHOST = "configured"')
+    pytester.syspathinsert()
+
+    new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin,env_source"}
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest("--pytest-env-verbose")
+
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(["  SET   URL=http://configured  (from plugin)", "  SET   EXTRA=1  (from env_source)"])
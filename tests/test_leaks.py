@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import os
+from textwrap import dedent
+from typing import TYPE_CHECKING
+from unittest import mock
+
+if TYPE_CHECKING:
+    import pytest
+
+
+def test_check_leaks_reports_unrestored_changes(pytester: pytest.Pytester) -> None:
+    (pytester.path / "pyproject.toml").write_text('[tool.pytest_env]\nMAGIC = "alpha"', encoding="utf-8")
+    pytester.makepyfile(
+        test_it=dedent("""\
+            import os
+
+            def test_leak_set():
+                os.environ["LEAKED"] = "1"
+
+            def test_leak_unset():
+                del os.environ["MAGIC"]
+
+            def test_monkeypatch(monkeypatch):
+                monkeypatch.setenv("PATCHED", "1")
+                monkeypatch.delenv("LEAKED")
+
+            def test_env_fixture(env):
+                env.update(FIXTURE="1")
+
+            def test_restored_by_hand():
+                os.environ["TEMPORARY"] = "1"
+                del os.environ["TEMPORARY"]
+        """),
+    )
+
+    new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest("--pytest-env-check-leaks")
+        assert type(os.environ._data) is dict  # ruff:ignore[private-member-access] # ty: ignore[unresolved-attribute]
+
+    result.assert_outcomes(passed=5)
+    result.stdout.fnmatch_lines([
+        "*pytest-env leaked environment variables*",
+        "test_it.py::test_leak_set: LEAKED",
+        "test_it.py::test_leak_unset: MAGIC",
+    ])
+    assert "test_monkeypatch" not in result.stdout.str()
+    assert "test_env_fixture" not in result.stdout.str()
+    assert "test_restored_by_hand" not in result.stdout.str()
+
+
+def test_check_leaks_allows_wider_scoped_fixtures(pytester: pytest.Pytester) -> None:
+    pytester.makepyfile(
+        test_it=dedent("""\
+            import os
+
+            import pytest
+
+            @pytest.fixture(scope="module")
+            def database():
+                with pytest.MonkeyPatch.context() as patch:
+                    patch.setenv("DB_URL", "sqlite://")
+                    yield
+
+            @pytest.fixture(scope="session", autouse=True)
+            def session_mode():
+                os.environ["MODE"] = "test"
+                yield
+                del os.environ["MODE"]
+
+            def test_a(database):
+                pass
+
+            def test_b():
+                os.environ["LEAKED"] = "1"
+
+            def test_c(database):
+                os.environ["LEAKED"] = "2"
+        """),
+    )
+
+    new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest("--pytest-env-check-leaks")
+
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines(["*pytest-env leaked environment variables*", "test_it.py::test_b: LEAKED"])
+    assert "DB_URL" not in result.stdout.str()
+    assert "MODE" not in result.stdout.str()
+    assert "::test_a" not in result.stdout.str()
+    assert "::test_c" not in result.stdout.str()
+
+
+def test_check_leaks_survives_nested_session(pytester: pytest.Pytester) -> None:
+    pytester.makepyfile(
+        test_it=dedent("""\
+            import os
+
+            pytest_plugins = ["pytester"]
+
+            def test_inline(pytester):
+                pytester.makepyfile(test_inner="def test_inner():\\n    pass\\n")
+                pytester.inline_run("--pytest-env-check-leaks").assertoutcome(passed=1)
+
+            def test_leak():
+                os.environ["LEAKED"] = "1"
+        """),
+    )
+
+    new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest("--pytest-env-check-leaks")
+        assert type(os.environ._data) is dict  # ruff:ignore[private-member-access] # ty: ignore[unresolved-attribute]
+
+    result.assert_outcomes(passed=2)
+    result.stdout.fnmatch_lines(["*pytest-env leaked environment variables*", "test_it.py::test_leak: LEAKED"])
+    assert "test_inline" not in result.stdout.str()
+
+
+def test_check_leaks_disabled_by_default(pytester: pytest.Pytester) -> None:
+    pytester.makepyfile(test_it="import os\n\ndef test_leak():\n    os.environ['LEAKED'] = '1'\n")
+
+    new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest()
+
+    result.assert_outcomes(passed=1)
+    assert "leaked" not in result.stdout.str()
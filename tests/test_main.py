@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import io
+import json
+import os
+import subprocess  # ruff:ignore[suspicious-subprocess-import]
+import sys
+from typing import TYPE_CHECKING
+from unittest import mock
+
+import pytest
+from dotenv import dotenv_values
+
+from pytest_env.__main__ import _format_dotenv, main  # ruff:ignore[import-private-name]
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+_INI = "[pytest]\nenv =\n    P:HOST=db\n    URL=pg://{HOST}\n    QUOTE=it's\n    LINES=a\\nb\n    U:GONE\n"
+
+
+@pytest.mark.parametrize(
+    ("output_format", "expected"),
+    [
+        pytest.param(
+            "shell",
+            "export URL=pg://db\nexport QUOTE='it'\"'\"'s'\nexport LINES='a\\nb'\nunset GONE\n",
+            id="shell",
+        ),
+        pytest.param("dotenv", "URL='pg://db'\nQUOTE=\"it's\"\nLINES='a\\\\nb'\n", id="dotenv"),
+        pytest.param(
+            "json",
+            json.dumps({"URL": "pg://db", "QUOTE": "it's", "LINES": "a\\nb", "GONE": None}, indent=2) + "\n",
+            id="json",
+        ),
+    ],
+)
+def test_main_formats(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+    monkeypatch: pytest.MonkeyPatch,
+    output_format: str,
+    expected: str,
+) -> None:
+    (tmp_path / "tox.ini").write_text(_INI, encoding="utf-8")
+    (tmp_path / "sub").mkdir()
+    monkeypatch.chdir(tmp_path / "sub")
+
+    with mock.patch.dict(os.environ, {}, clear=True):
+        assert main(["--format", output_format]) == 0
+
+    assert capsys.readouterr().out == expected
+
+
+def test_main_dotenv_escapes_multiline_values(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    (tmp_path / "pytest.toml").write_text('[pytest_env]\nMAGIC = "say \\"hi\\"\\nto\\\\all"', encoding="utf-8")
+
+    assert main(["-c", str(tmp_path / "pytest.toml"), "--format", "dotenv"]) == 0
+
+    assert capsys.readouterr().out == 'MAGIC="say \\"hi\\"\\nto\\\\all"\n'
+
+
+def test_main_dotenv_round_trips() -> None:
+    changes: dict[str, str | None] = {
+        "PLAIN": "value",
+        "DOLLAR": "$HOME and $",
+        "REFERENCE": "${HOME}-$${HOME}-${HOME:-default}",
+        "BACKSLASH": "C:\\temp\\new\\",
+        "ESCAPES": "\\n \\' \\\\",
+        "QUOTES": 'it\'s "quoted" ${HOME}',
+        "LINES": "one\ntwo\\n",
+    }
+    with mock.patch.dict(os.environ, {"HOME": "/home/user"}, clear=True):
+        assert dotenv_values(stream=io.StringIO(_format_dotenv(changes))) == changes
+
+
+@pytest.mark.parametrize(
+    ("files", "expected"),
+    [
+        pytest.param(
+            {"setup.cfg": "[metadata]\nname = x", "pyproject.toml": '[tool.pytest.ini_options]\nenv = ["MAGIC=ini"]'},
+            {"MAGIC": "ini"},
+            id="setup.cfg without pytest section is skipped",
+        ),
+        pytest.param(
+            {
+                ".env": "MAGIC=file",
+                "pyproject.toml": '[tool.pytest.ini_options]\nenv_files = ".env"\nenv_files_skip_if_set = "true"',
+            },
+            {},
+            id="ini options strings",
+        ),
+        pytest.param(
+            {"pyproject.toml": '[tool.pytest]\nenv = ["MAGIC=native"]', "setup.cfg": "[tool:pytest]\nenv = MAGIC=cfg"},
+            {"MAGIC": "native"},
+            id="native pytest table",
+        ),
+        pytest.param(
+            {"pyproject.toml": "[tool.other]\nkey = 1", "setup.cfg": "[tool:pytest]\nenv = MAGIC=cfg"},
+            {"MAGIC": "cfg"},
+            id="pyproject without pytest table is skipped",
+        ),
+        pytest.param({".pytest.ini": "", "pytest.toml": '[pytest_env]\nMAGIC = "toml"'}, {"MAGIC": "toml"}, id="toml"),
+        pytest.param({}, {}, id="no configuration"),
+    ],
+)
+def test_main_locates_configuration(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+    monkeypatch: pytest.MonkeyPatch,
+    files: dict[str, str],
+    expected: dict[str, str],
+) -> None:
+    for name, content in files.items():
+        (tmp_path / name).write_text(content, encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+
+    with mock.patch.dict(os.environ, {"MAGIC": "outer"}, clear=True):
+        assert main(["--format", "json"]) == 0
+
+    assert json.loads(capsys.readouterr().out) == expected
+
+
+@pytest.mark.parametrize(
+    ("anchor", "args"),
+    [
+        pytest.param(
+            {"pyproject.toml": '[tool.pytest_env]\nenv_files = [".env"]', ".env": "FROM_FILE=1"}, [], id="pyproject"
+        ),
+        pytest.param({"setup.py": "", "local.env": "FROM_FILE=1"}, ["--envfile", "local.env"], id="setup.py"),
+    ],
+)
+def test_main_anchors_root_without_pytest_settings(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+    monkeypatch: pytest.MonkeyPatch,
+    anchor: dict[str, str],
+    args: list[str],
+) -> None:
+    for name, content in anchor.items():
+        (tmp_path / name).write_text(content, encoding="utf-8")
+    (tmp_path / "sub").mkdir()
+    monkeypatch.chdir(tmp_path / "sub")
+
+    with mock.patch.dict(os.environ, {}, clear=True):
+        assert main([*args, "--format", "json"]) == 0
+
+    assert json.loads(capsys.readouterr().out) == {"FROM_FILE": "1"}
+
+
+def test_main_cli_sources(tmp_path: Path, capsys: pytest.CaptureFixture[str], monkeypatch: pytest.MonkeyPatch) -> None:
+    (tmp_path / "pytest.ini").write_text("[pytest]\n", encoding="utf-8")
+    (tmp_path / "local.env").write_text("FROM_FILE=1", encoding="utf-8")
+    (tmp_path / "secrets").mkdir()
+    (tmp_path / "secrets" / "FROM_DIR").write_text("2\n", encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+
+    assert main(["--envfile", "local.env", "--envdir", "secrets", "--format", "json"]) == 0
+
+    assert json.loads(capsys.readouterr().out) == {"FROM_FILE": "1", "FROM_DIR": "2"}
+
+
+def test_main_reports_errors(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+
+    with pytest.raises(SystemExit) as exc_info:
+        main(["--envfile", "missing.env"])
+
+    assert exc_info.value.code == 2
+    assert "error: Environment file not found: missing.env" in capsys.readouterr().err
+
+
+def test_main_does_not_import_pytest(tmp_path: Path) -> None:
+    (tmp_path / "pytest.ini").write_text("[pytest]\nenv = MAGIC=alpha", encoding="utf-8")
+    code = "import sys\nfrom pytest_env.__main__ import main\nmain([])\nprint('_pytest' in sys.modules)"
+
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, capture_output=True, text=True, check=True)
+
+    assert result.stdout == "export MAGIC=alpha\nFalse\n"
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+from textwrap import dedent
+from unittest import mock
+
+import pytest
+
+from pytest_env.plugin import _strip_matrix_args  # ruff:ignore[import-private-name]
+
+
+@pytest.fixture
+def project(pytester: pytest.Pytester) -> pytest.Pytester:
+    (pytester.path / "a.env").write_text("MAGIC=a", encoding="utf-8")
+    (pytester.path / "b.env").write_text("MAGIC=b", encoding="utf-8")
+    (pytester.path / "pyproject.toml").write_text(
+        '[tool.pytest_env]\nRESULT = {value = "{MAGIC}-x", transform = true}', encoding="utf-8"
+    )
+    pytester.makepyfile(
+        test_it=dedent("""\
+            import os
+
+            def test_result():
+                assert os.environ["RESULT"] == os.environ["MAGIC"] + "-x"
+
+            def test_only_a():
+                assert os.environ["MAGIC"] == "a"
+        """),
+    )
+    return pytester
+
+
+@pytest.fixture
+def plugin_env() -> dict[str, str]:
+    return {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+
+
+def test_env_matrix_runs_every_variant(project: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = project.runpytest("-v", "--env-matrix", "a.env,b.env", "--env-matrix-workers=2")
+
+    result.assert_outcomes(passed=3, failed=1)
+    result.stdout.fnmatch_lines(
+        [
+            "*test_it.py::test_result@a.env PASSED*",
+            "*test_it.py::test_only_a@a.env PASSED*",
+            "*test_it.py::test_result@b.env PASSED*",
+            "*test_it.py::test_only_a@b.env FAILED*",
+        ],
+        consecutive=True,
+    )
+    assert result.ret == pytest.ExitCode.TESTS_FAILED
+
+
+def test_env_matrix_counts_each_failure_once(project: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    project.makeconftest("def pytest_sessionfinish(session):\n    print(f'testsfailed={session.testsfailed}')\n")
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = project.runpytest("-s", "--env-matrix", "a.env,b.env")
+
+    result.assert_outcomes(passed=3, failed=1)
+    result.stdout.fnmatch_lines(["*testsfailed=1*"])
+
+
+def test_env_matrix_writes_one_junit_report(project: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = project.runpytest("--env-matrix", "a.env,b.env", "--junitxml", "report.xml")
+
+    result.assert_outcomes(passed=3, failed=1)
+    report = (project.path / "report.xml").read_text(encoding="utf-8")
+    assert sorted(re.findall(r'<testcase [^>]*name="([^"]+)"', report)) == [
+        "test_only_a@a.env",
+        "test_only_a@b.env",
+        "test_result@a.env",
+        "test_result@b.env",
+    ]
+    assert not list(project.path.glob("cache-*"))
+    lastfailed = json.loads((project.path / ".pytest_cache" / "v" / "cache" / "lastfailed").read_text(encoding="utf-8"))
+    assert list(lastfailed) == ["test_it.py::test_only_a@b.env"]
+
+
+def test_strip_matrix_args() -> None:
+    args = ["-v", "--env-matrix", "a.env", "--env-matrix-workers=2", "--junitxml", "x.xml", "--junit-xml=y.xml", "--lf"]
+
+    assert _strip_matrix_args(args) == ["-v", "--lf"]
+
+
+def test_env_matrix_missing_variant_fails_before_running(project: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = project.runpytest("--env-matrix=a.env,missing.env")
+
+    assert result.ret != 0
+    assert any("Environment file not found: missing.env" in line for line in result.errlines)
+
+
+@pytest.mark.parametrize("terminal", [pytest.param(True, id="terminal"), pytest.param(False, id="no terminal")])
+def test_env_matrix_reports_crashed_variant(
+    project: pytest.Pytester, plugin_env: dict[str, str], *, terminal: bool
+) -> None:
+    project.makeconftest("import os\n\nif os.environ['MAGIC'] == 'b':\n    raise RuntimeError('broken variant')\n")
+    args = ["--env-matrix", "a.env,b.env", "--env-matrix-workers", "1"]
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = project.runpytest(*args) if terminal else project.runpytest("-p", "no:terminal", *args)
+
+    assert result.ret == pytest.ExitCode.TESTS_FAILED
+    if terminal:
+        result.assert_outcomes(passed=2)
+        result.stdout.fnmatch_lines(["*pytest-env matrix variant b.env exited with 4*", "*broken variant*"])
+
+
+def test_env_matrix_replays_collection_errors(project: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    project.makepyfile(
+        test_broken="import os\n\nif os.environ['MAGIC'] == 'b':\n    raise RuntimeError('broken module')\n"
+    )
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = project.runpytest("--env-matrix", "a.env,b.env")
+
+    result.assert_outcomes(passed=2, errors=1)
+    result.stdout.fnmatch_lines(["*ERROR collecting test_broken.py@b.env*", "*broken module*"])
+
+
+def test_env_matrix_resolves_generated_values_per_variant(project: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    (project.path / "pyproject.toml").write_text('[tool.pytest_env]\nRUN_ID = { generate = "uuid" }', encoding="utf-8")
+    project.makepyfile(test_it="import os\n\ndef test_run_id():\n    assert len(os.environ['RUN_ID']) == 36\n")
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = project.runpytest("--env-matrix", "a.env,b.env")
+
+    result.assert_outcomes(passed=2)
+
+
+def test_env_matrix_hands_off_large_plans(project: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    entries = "".join(f'VAR_{index} = "{"x" * 60}"\n' for index in range(3000))  # handoff well above 128 KiB
+    (project.path / "pyproject.toml").write_text(f"[tool.pytest_env]\n{entries}", encoding="utf-8")
+    project.makepyfile(test_it="import os\n\ndef test_last():\n    assert os.environ['VAR_2999'] == 'x' * 60\n")
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        result = project.runpytest("--env-matrix", "a.env,b.env")
+
+    result.assert_outcomes(passed=2)
+
+
+def test_matrix_report_writer_serializes_reports(project: pytest.Pytester, plugin_env: dict[str, str]) -> None:
+    project.makepyfile(test_broken="raise RuntimeError('broken module')\n")
+    report_path = project.path / "reports.jsonl"
+
+    with mock.patch.dict(os.environ, plugin_env, clear=True):
+        project.runpytest(
+            "--envfile", "a.env", "--continue-on-collection-errors", "--pytest-env-matrix-report", str(report_path)
+        )
+
+    reports = [json.loads(line) for line in report_path.read_text(encoding="utf-8").splitlines()]
+    assert [(report["$report_type"], report["nodeid"]) for report in reports] == [
+        ("CollectReport", "test_broken.py"),
+        *(("TestReport", f"test_it.py::{name}") for name in ("test_result", "test_only_a") for _ in range(3)),
+    ]
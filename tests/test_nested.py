@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import os
+from textwrap import dedent
+from typing import TYPE_CHECKING
+from unittest import mock
+
+import pytest
+
+from pytest_env.plugin import NestedConfigs
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def _write_test(path: Path, expected: str | None) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        dedent(f"""\
+            import os
+
+            def test_it() -> None:
+                assert os.environ.get("MAGIC") == {expected!r}
+        """),
+        encoding="utf-8",
+    )
+
+
+@pytest.mark.parametrize(
+    "root_config",
+    [
+        pytest.param('[tool.pytest_env]\nMAGIC = "root"\nenv_nested_configs = true', id="toml setting"),
+        pytest.param(
+            '[tool.pytest_env]\nMAGIC = "root"\n[tool.pytest.ini_options]\nenv_nested_configs = true', id="ini"
+        ),
+    ],
+)
+def test_nested_configs_apply_to_their_subtree(pytester: pytest.Pytester, root_config: str) -> None:
+    (pytester.path / "pyproject.toml").write_text(root_config, encoding="utf-8")
+    (pytester.path / "svc_a").mkdir()
+    (pytester.path / "svc_a" / "pytest.toml").write_text('[pytest_env]\nMAGIC = "a"', encoding="utf-8")
+    (pytester.path / "svc_b").mkdir()
+    (pytester.path / "svc_b" / ".env").write_text("MAGIC=b", encoding="utf-8")
+    (pytester.path / "svc_b" / "pyproject.toml").write_text(
+        '[tool.pytest_env]\nenv_files = [".env", "missing.env"]', encoding="utf-8"
+    )
+    (pytester.path / "svc_d" / "secrets").mkdir(parents=True)
+    (pytester.path / "svc_d" / "secrets" / "MAGIC").write_text("d\n", encoding="utf-8")
+    (pytester.path / "svc_d" / "pytest.toml").write_text(
+        '[pytest_env]\nenv_dirs = ["secrets", "gone"]', encoding="utf-8"
+    )
+    (pytester.path / "svc_c").mkdir()
+    (pytester.path / "svc_c" / "pyproject.toml").write_text("[tool.other]\nkey = 1", encoding="utf-8")
+    _write_test(pytester.path / "svc_a" / "test_a.py", "a")
+    _write_test(pytester.path / "svc_a" / "deep" / "test_deep.py", "a")
+    _write_test(pytester.path / "svc_b" / "test_b.py", "b")
+    _write_test(pytester.path / "svc_c" / "test_c.py", "root")
+    _write_test(pytester.path / "svc_d" / "test_d.py", "d")
+    _write_test(pytester.path / "test_root.py", "root")
+
+    new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest()
+
+    result.assert_outcomes(passed=6)
+
+
+def test_nested_configs_disabled_by_default(pytester: pytest.Pytester) -> None:
+    (pytester.path / "pyproject.toml").write_text('[tool.pytest_env]\nMAGIC = "root"', encoding="utf-8")
+    (pytester.path / "svc_a").mkdir()
+    (pytester.path / "svc_a" / "pytest.toml").write_text('[pytest_env]\nMAGIC = "a"', encoding="utf-8")
+    _write_test(pytester.path / "svc_a" / "test_a.py", "root")
+
+    new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest()
+
+    result.assert_outcomes(passed=1)
+
+
+def test_nested_configs_lookup_is_memoized(tmp_path: Path) -> None:
+    (tmp_path / "pkg" / "sub").mkdir(parents=True)
+    (tmp_path / "pkg" / "pytest.toml").write_text('[pytest_env]\nMAGIC = "pkg"', encoding="utf-8")
+    nested = NestedConfigs(tmp_path)
+
+    assert nested.lookup(tmp_path / "pkg" / "sub") == tmp_path / "pkg" / "pytest.toml"
+    (tmp_path / "pkg" / "pytest.toml").unlink()
+    assert nested.lookup(tmp_path / "pkg") == tmp_path / "pkg" / "pytest.toml"
+    assert nested.lookup(tmp_path) is None
+    assert nested.lookup(tmp_path.parent) is None
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from unittest import mock
+
+import pytest_env
+
+
+def test_override_layers_on_top_of_os_environ() -> None:
+    with mock.patch.dict(os.environ, {"MAGIC": "session", "HIDDEN": "1"}, clear=True):
+        with pytest_env.override({"MAGIC": "outer"}, EXTRA="1"):
+            with pytest_env.override(MAGIC="inner", HIDDEN=None):
+                assert dict(pytest_env.environ) == {"MAGIC": "inner", "EXTRA": "1"}
+                assert len(pytest_env.environ) == 2
+                assert pytest_env.getenv("HIDDEN") is None
+                assert pytest_env.getenv("HIDDEN", "default") == "default"
+            assert pytest_env.getenv("MAGIC") == "outer"
+            assert os.environ["MAGIC"] == "session"
+        assert repr(pytest_env.environ) == "pytest_env.environ({'MAGIC': 'session', 'HIDDEN': '1'})"
+
+
+def test_override_is_per_thread() -> None:
+    barrier = threading.Barrier(4)
+    seen: dict[int, str | None] = {}
+
+    def worker(index: int) -> None:
+        with pytest_env.override(MAGIC=str(index)):
+            barrier.wait()
+            seen[index] = pytest_env.getenv("MAGIC")
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert seen == {0: "0", 1: "1", 2: "2", 3: "3"}
+
+
+def test_override_is_per_task() -> None:
+    async def task(value: str, started: asyncio.Event, other_started: asyncio.Event) -> str | None:
+        with pytest_env.override(MAGIC=value):
+            started.set()
+            await other_started.wait()
+            return pytest_env.getenv("MAGIC")
+
+    async def main() -> list[str | None]:
+        first, second = asyncio.Event(), asyncio.Event()
+        return list(await asyncio.gather(task("a", first, second), task("b", second, first)))
+
+    assert asyncio.run(main()) == ["a", "b"]
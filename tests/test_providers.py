@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import TYPE_CHECKING, ClassVar
+from unittest import mock
+
+import pytest
+
+from pytest_env.plugin import Entry, EnvPatcher
+from pytest_env.providers import AgentProvider, close_providers, get_provider, register_provider
+
+if TYPE_CHECKING:
+    from collections.abc import Generator, Mapping
+    from pathlib import Path
+    from socketserver import BaseServer
+
+_SECRETS = {"db/password": "s3cret", "api/token": "t0ken"}
+
+
+class _AgentHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests: ClassVar[list[dict[str, str]]] = []
+    connections: ClassVar[list[object]] = []
+
+    def setup(self) -> None:
+        super().setup()
+        self.connections.append(self)
+
+    def do_POST(self) -> None:
+        requested = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["secrets"]
+        self.requests.append(requested)
+        payload = {"secrets": {key: _SECRETS[path] for key, path in requested.items() if path in _SECRETS}}
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # ruff:ignore[builtin-argument-shadowing]
+        pass
+
+
+@contextmanager
+def _serve(server: BaseServer) -> Generator[BaseServer, None, None]:
+    _AgentHandler.requests.clear()
+    _AgentHandler.connections.clear()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        close_providers()
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def agent() -> Generator[str, None, None]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _AgentHandler)
+    with _serve(server):
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+def test_agent_over_unix_socket_reuses_connection(tmp_path: Path) -> None:
+    class Server(ThreadingMixIn, UnixStreamServer):
+        daemon_threads = True
+
+    socket_path = tmp_path / "agent.sock"
+    with _serve(Server(str(socket_path), _AgentHandler)):
+        provider = AgentProvider(f"unix://{socket_path}")
+        assert provider.fetch({"DB_PASSWORD": "db/password"}) == {"DB_PASSWORD": "s3cret"}
+        assert provider.fetch({"API_TOKEN": "api/token"}) == {"API_TOKEN": "t0ken"}
+        provider.close()
+
+    assert len(_AgentHandler.connections) == 1
+
+
+def test_provider_entries_fetched_in_one_batch(pytester: pytest.Pytester, agent: str) -> None:
+    (pytester.path / "pyproject.toml").write_text(
+        """\
+[tool.pytest_env]
+DB_PASSWORD = { provider = "agent", path = "db/password" }
+API_TOKEN = { provider = "agent", path = "api/token" }
+DSN = { value = "postgres://app:{DB_PASSWORD}@db", transform = true }
+""",
+        encoding="utf-8",
+    )
+    pytester.makepyfile(
+        test_it="""\
+import os
+
+def test_it():
+    assert os.environ["API_TOKEN"] == "t0ken"
+    assert os.environ["DSN"] == "postgres://app:s3cret@db"
+""",
+    )
+
+    new_env = {
+        "PYTEST_ENV_SECRETS_AGENT": agent,
+        "PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1",
+        "PYTEST_PLUGINS": "pytest_env.plugin",
+    }
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest()
+
+    result.assert_outcomes(passed=1)
+    assert _AgentHandler.requests == [{"DB_PASSWORD": "db/password", "API_TOKEN": "api/token"}]
+    assert len(_AgentHandler.connections) == 1
+
+
+def test_agent_retries_dropped_connection(agent: str) -> None:
+    provider = AgentProvider(agent)
+    with mock.patch.object(
+        provider, "_post", side_effect=[http.client.RemoteDisconnected("closed"), (200, b'{"secrets": {}}')]
+    ):
+        assert provider.fetch({"MISSING": "missing"}) == {}
+
+
+def test_agent_error_status(agent: str) -> None:
+    provider = AgentProvider(agent)
+    with mock.patch.object(provider, "_post", return_value=(503, b"sealed")), pytest.raises(RuntimeError, match="503"):
+        provider.fetch({"DB_PASSWORD": "db/password"})
+
+
+def test_missing_secret_is_an_error(agent: str) -> None:
+    with mock.patch.dict(os.environ, {"PYTEST_ENV_SECRETS_AGENT": agent}):
+        patcher = EnvPatcher()
+        with pytest.raises(LookupError, match="agent returned no value for MISSING"):
+            patcher.apply_entries([Entry("MISSING", "", transform=False, skip_if_set=False, provider="agent")])
+
+
+@pytest.mark.parametrize(
+    ("name", "environ", "error", "match"),
+    [
+        pytest.param("vault", {}, LookupError, "Unknown secrets provider: vault", id="unknown provider"),
+        pytest.param("agent", {}, LookupError, "Set PYTEST_ENV_SECRETS_AGENT", id="agent without address"),
+        pytest.param(
+            "agent", {"PYTEST_ENV_SECRETS_AGENT": "ftp://agent"}, ValueError, "Unsupported", id="unsupported address"
+        ),
+    ],
+)
+def test_get_provider_errors(name: str, environ: dict[str, str], error: type[Exception], match: str) -> None:
+    with pytest.raises(error, match=match):
+        get_provider(name, environ)
+
+
+def test_register_custom_provider() -> None:
+    class Static:
+        calls: ClassVar[list[Mapping[str, str]]] = []
+
+        def fetch(self, requests: Mapping[str, str]) -> Mapping[str, str]:
+            self.calls.append(requests)
+            return {key: path.upper() for key, path in requests.items()}
+
+    register_provider("static", lambda _: Static())
+    entries = [
+        Entry("FIRST", "", transform=False, skip_if_set=False, provider="static", path="one"),
+        Entry("SECOND", "", transform=False, skip_if_set=False, provider="static", path="two"),
+    ]
+    with mock.patch.dict(os.environ, clear=True):
+        patcher = EnvPatcher()
+        patcher.apply_entries(entries)
+        assert dict(os.environ) == {"FIRST": "ONE", "SECOND": "TWO"}
+        patcher.undo()
+    assert get_provider("static", {}) is get_provider("static", {})
+    close_providers()
+
+    assert Static.calls == [{"FIRST": "one", "SECOND": "two"}]
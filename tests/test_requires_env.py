@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import os
+from textwrap import dedent
+from typing import TYPE_CHECKING
+from unittest import mock
+
+if TYPE_CHECKING:
+    import pytest
+
+
+def test_requires_env_skips_unmet_tests_before_setup(pytester: pytest.Pytester) -> None:
+    pytester.makepyfile(
+        test_it=dedent("""\
+            from functools import partial
+
+            import pytest
+
+            calls = []
+
+            def is_port(value):
+                calls.append(value)
+                return value.isdigit()
+
+            @pytest.fixture
+            def expensive():
+                raise AssertionError("fixture set up for a skipped test")
+
+            @pytest.mark.requires_env("MISSING")
+            def test_missing(expensive): ...
+
+            @pytest.mark.requires_env("DB_HOST", DB_PORT=is_port)
+            def test_present_1(): ...
+
+            @pytest.mark.requires_env("DB_HOST", DB_PORT=is_port)
+            def test_present_2():
+                assert calls == ["5432"]
+
+            @pytest.mark.requires_env(MODE="prod")
+            def test_value_mismatch(expensive): ...
+
+            @pytest.mark.pytest_env(MODE="prod")
+            @pytest.mark.requires_env(MODE="prod")
+            def test_value_from_marker(): ...
+
+            @pytest.mark.requires_env(DB_HOST=str.isdigit)
+            def test_predicate_fails(expensive): ...
+
+            @pytest.mark.requires_env(DB_HOST=partial(str.startswith, "z"))
+            def test_partial_fails(expensive): ...
+        """),
+    )
+    pytester.makefile(".toml", pytest='[pytest_env]\nDB_HOST = "db"\nDB_PORT = "5432"\nMODE = "test"')
+
+    new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin"}
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        result = pytester.runpytest("-rs")
+
+    result.assert_outcomes(passed=3, skipped=4)
+    result.stdout.fnmatch_lines_random([
+        "SKIPPED * requires environment variable MISSING",
+        "SKIPPED * requires environment variable MODE=prod",
+        "SKIPPED * requires environment variable DB_HOST to satisfy str.isdigit",
+        "SKIPPED * requires environment variable DB_HOST to satisfy functools.partial(<method 'startswith' of 'str'*",
+    ])
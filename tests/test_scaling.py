@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import os
+import sys
+from collections import Counter
+from typing import TYPE_CHECKING
+from unittest import mock
+
+import pytest
+
+from pytest_env import resolve
+from pytest_env.plugin import pytest_load_initial_conftests
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+    from types import FrameType
+
+_SMALL, _LARGE = 200, 1600
+_GROWTH = 1.5  # slack over linear growth between the two sizes, quadratic growth needs _LARGE / _SMALL more
+_ENTRY_BUDGET = 300  # function calls allowed per entry
+
+
+def _entries(path: Path, size: int) -> tuple[Path, dict[str, str]]:
+    (path / "pytest.toml").write_text(
+        "[pytest_env]\n" + "".join(f'VAR_{index} = "value {index}"\n' for index in range(size)), encoding="utf-8"
+    )
+    return path, {}
+
+
+def _env_lines(path: Path, size: int) -> tuple[Path, dict[str, str]]:
+    (path / ".env").write_text("".join(f"VAR_{index}='value {index}'\n" for index in range(size)), encoding="utf-8")
+    (path / "pytest.toml").write_text('[pytest_env]\nenv_files = [".env"]\n', encoding="utf-8")
+    return path, {}
+
+
+def _transform_references(path: Path, size: int) -> tuple[Path, dict[str, str]]:
+    lines = ['VAR_0 = "value"\n']
+    lines.extend(f'VAR_{index} = {{ value = "{{VAR_{index - 1}}}", transform = true }}\n' for index in range(1, size))
+    (path / "pytest.toml").write_text("[pytest_env]\n" + "".join(lines), encoding="utf-8")
+    return path, {}
+
+
+def _directory_depth(path: Path, size: int) -> tuple[Path, dict[str, str]]:
+    (path / "pytest.toml").write_text('[pytest_env]\nVAR = "value"\n', encoding="utf-8")
+    (deep := path.joinpath(*["d"] * (size // 25))).mkdir(parents=True)
+    (deep / "pytest.ini").write_text("[pytest]\n", encoding="utf-8")
+    return deep, {}
+
+
+def _environ_size(path: Path, size: int) -> tuple[Path, dict[str, str]]:
+    (path / "pytest.toml").write_text(
+        "[pytest_env]\n"
+        + "".join(f'VAR_{index} = {{ value = "{{OUTER_{index}}}", transform = true }}\n' for index in range(size)),
+        encoding="utf-8",
+    )
+    return path, {f"OUTER_{index}": f"value {index}" for index in range(size)}
+
+
+def _startup_calls(pytester: pytest.Pytester, scenario: Callable[..., tuple[Path, dict[str, str]]], size: int) -> int:
+    """Count the Python and C function calls resolving the environment makes, which unlike time is not noisy."""
+    (path := pytester.path / f"size_{size}").mkdir()
+    directory, environ = scenario(path, size)
+    new_env = {"PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1", "PYTEST_PLUGINS": "pytest_env.plugin", **environ}
+    calls = Counter[str]()
+
+    def profile(_frame: FrameType, event: str, _arg: object) -> None:
+        calls[event] += 1  # pragma: no cover # profile functions run untraced
+
+    with mock.patch.dict(os.environ, new_env, clear=True):
+        config = pytester.parseconfig(str(directory))
+        with mock.patch.dict(os.environ), mock.patch.dict(resolve._toml_configs, clear=True):  # ruff:ignore[private-member-access]
+            sys.setprofile(profile)
+            try:
+                pytest_load_initial_conftests([], config, config._parser)  # ruff:ignore[private-member-access]
+            finally:
+                sys.setprofile(None)
+    return calls["call"] + calls["c_call"]
+
+
+@pytest.mark.parametrize(
+    "scenario",
+    [
+        pytest.param(_entries, id="entries"),
+        pytest.param(_env_lines, id="env lines"),
+        pytest.param(_transform_references, id="transform references"),
+        pytest.param(_directory_depth, id="directory depth"),
+        pytest.param(_environ_size, id="environ size"),
+    ],
+)
+def test_startup_scales_linearly(
+    pytester: pytest.Pytester, scenario: Callable[..., tuple[Path, dict[str, str]]]
+) -> None:
+    small = _startup_calls(pytester, scenario, _SMALL)
+    large = _startup_calls(pytester, scenario, _LARGE)
+
+    assert large / small < _LARGE / _SMALL * _GROWTH
+    assert large / _LARGE < _ENTRY_BUDGET